@@ -0,0 +1,420 @@
+# api/server.py
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow responses are optional
+    pa = None
+
+from etl.aggregates import AGGREGATE_SPECS, read_aggregate
+from etl.ingest import load_all_data
+from etl.result_cache import ResultCache, data_version
+from etl.timeline import build_timeline_index, load_timeline_index
+from etl.transform import transform_all
+from models.rfm_segmentation import assign_rfm_scores, calculate_rfm
+from models.roi_forecast import forecast_roi, prepare_time_series
+
+# configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path("data/cleaned")
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 10_000
+DEFAULT_FORECAST_PERIODS = 30
+MAX_FORECAST_PERIODS = 365
+VERSION_CHECK_SECONDS = 1.0  # how long a data version fingerprint is trusted
+VERSION_RETRIES = 3          # attempts at answering from one data version while files change
+KEEP_ALIVE_SECONDS = 15.0    # idle time before a keep-alive connection is closed
+MAX_HEADER_BYTES = 64 << 10
+MAX_BODY_BYTES = 1 << 20     # largest (ignored) request body read off the connection
+MIN_GZIP_BYTES = 1024        # smaller bodies are sent uncompressed
+CACHE_MAX_BYTES = 128 << 20
+
+JSON_TYPE = "application/json"
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+
+REASONS = {
+    200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 406: "Not Acceptable", 500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class ApiError(Exception):
+    """A request error reported to the client with an HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class VersionChanged(Exception):
+    """The data files changed while a result for an older data version was computed."""
+
+
+@dataclass
+class Response:
+    status: int
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+
+class ApiStore:
+    """
+    Read-only view of the ETL outputs for the API.
+
+    Every table is computed at most once per data version and kept in a
+    bounded ResultCache, so polling clients only cost a cache lookup. The
+    data version is the same fingerprint the dashboard uses, re-checked at
+    most every `version_ttl` seconds; callers pass the version they read to
+    every table method, so a response and its ETag share one version.
+    """
+
+    def __init__(
+        self,
+        data_dir: Path = DATA_DIR,
+        version_ttl: float = VERSION_CHECK_SECONDS,
+        cache_bytes: int = CACHE_MAX_BYTES,
+    ):
+        self.data_dir = Path(data_dir)
+        self.version_ttl = version_ttl
+        self.cache = ResultCache(max_bytes=cache_bytes)
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def version(self, refresh: bool = False) -> str:
+        with self._lock:
+            now = time.monotonic()
+            if refresh or self._version is None or now - self._checked_at >= self.version_ttl:
+                self._version = data_version(self.data_dir)
+                self._checked_at = now
+            return self._version
+
+    def _cached(self, version: str, key: Tuple, compute: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Result of `compute` for `version`. A miss reads the data directory,
+        so the files must still match `version` once it is done; otherwise
+        VersionChanged is raised and nothing is cached.
+        """
+        def snapshot() -> pd.DataFrame:
+            value = compute()
+            if data_version(self.data_dir) != version:
+                raise VersionChanged(version)
+            return value
+        return self.cache.get_or_compute((version,) + key, snapshot)
+
+    def rollup_names(self) -> List[str]:
+        return [name for name in AGGREGATE_SPECS if (self.data_dir / f"{name}.csv").exists()]
+
+    def rollup(self, name: str, version: str) -> pd.DataFrame:
+        if name not in self.rollup_names():
+            raise ApiError(404, f"Unknown rollup {name!r}; available: {', '.join(self.rollup_names())}")
+        return self._cached(version, ("rollup", name), lambda: read_aggregate(name, self.data_dir).reset_index())
+
+    def _timeline(self):
+        """The timeline index kept by the ETL and watch mode, built from the cleaned CSVs only if missing."""
+        timeline = load_timeline_index(self.data_dir / "timeline")
+        if timeline is None:
+            timeline = build_timeline_index(transform_all(load_all_data(self.data_dir)))
+        return timeline
+
+    def rfm(self, version: str) -> pd.DataFrame:
+        return self._cached(version, ("rfm",), lambda: assign_rfm_scores(calculate_rfm(timeline=self._timeline())))
+
+    def forecast(self, periods: int, version: str) -> pd.DataFrame:
+        """Next `periods` days of revenue, sliced from one MAX_FORECAST_PERIODS forecast per data version."""
+        def compute() -> pd.DataFrame:
+            if "daily_revenue" not in self.rollup_names():
+                raise ApiError(404, "No revenue history; run the ETL first")
+            history = self.rollup("daily_revenue", version)
+            ts = prepare_time_series(history, date_col="date", value_col="revenue", freq="D")
+            forecast = forecast_roi(ts, periods=MAX_FORECAST_PERIODS).clip(lower=0)
+            return pd.DataFrame({"date": forecast.index, "forecast_revenue": forecast.to_numpy()})
+        return self._cached(version, ("forecast",), compute).iloc[:periods]
+
+
+# --- Request handling ---
+
+def _int_param(params: Dict[str, str], name: str, default: int, low: int, high: int) -> int:
+    raw = params.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ApiError(400, f"Parameter {name!r} must be an integer")
+    if not low <= value <= high:
+        raise ApiError(400, f"Parameter {name!r} must be between {low} and {high}")
+    return value
+
+
+def _select_columns(table: pd.DataFrame, params: Dict[str, str]) -> pd.DataFrame:
+    if not params.get("columns"):
+        return table
+    columns = [c.strip() for c in params["columns"].split(",") if c.strip()]
+    unknown = [c for c in columns if c not in table.columns]
+    if unknown:
+        raise ApiError(400, f"Unknown columns {unknown}; available: {list(table.columns)}")
+    return table[columns]
+
+
+def _filter_dates(table: pd.DataFrame, params: Dict[str, str], date_col: str = "date") -> pd.DataFrame:
+    mask = pd.Series(True, index=table.index)
+    for name, keep in (("start", lambda d, b: d >= b), ("end", lambda d, b: d <= b)):
+        if params.get(name):
+            try:
+                bound = pd.Timestamp(params[name])
+            except ValueError:
+                raise ApiError(400, f"Parameter {name!r} must be a date")
+            mask &= keep(table[date_col], bound)
+    return table[mask]
+
+
+def _wants_arrow(params: Dict[str, str], headers: Dict[str, str]) -> bool:
+    fmt = params.get("format")
+    if fmt is not None and fmt not in ("json", "arrow"):
+        raise ApiError(400, "Parameter 'format' must be 'json' or 'arrow'")
+    wants = fmt == "arrow" or (fmt is None and ARROW_TYPE in headers.get("accept", ""))
+    if wants and pa is None:
+        raise ApiError(406, "Arrow responses need pyarrow installed")
+    return wants
+
+
+def _page(table: pd.DataFrame, params: Dict[str, str]) -> Tuple[pd.DataFrame, dict]:
+    page_size = _int_param(params, "page_size", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    pages = max(1, math.ceil(len(table) / page_size))
+    page = _int_param(params, "page", 1, 1, pages)
+    rows = table.iloc[(page - 1) * page_size: page * page_size]
+    return rows, {"page": page, "page_size": page_size, "total_rows": len(table), "total_pages": pages}
+
+
+def _json_body(payload: dict, rows: Optional[pd.DataFrame] = None) -> bytes:
+    """JSON envelope; table rows are serialized by pandas rather than per-cell Python objects."""
+    if rows is None:
+        return json.dumps(payload).encode()
+    records = rows.to_json(orient="records", date_format="iso")
+    return (json.dumps(payload)[:-1] + f', "rows": {records}}}').encode()
+
+
+def _arrow_body(rows: pd.DataFrame, meta: dict) -> bytes:
+    table = pa.Table.from_pandas(rows, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"mrip": json.dumps(meta).encode()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _etag(version: str, path: str, params: Dict[str, str], arrow: bool) -> str:
+    """Weak validator: same data version and same query give the same ETag (any content-encoding)."""
+    key = json.dumps([path, sorted(params.items()), arrow])
+    return f'W/"{version}-{hashlib.sha1(key.encode()).hexdigest()[:12]}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return "*" in tags or any((t[2:] if t.startswith("W/") else t) == bare for t in tags)
+
+
+def _table_response(
+    name: str, table: pd.DataFrame, params: Dict[str, str], version: str, arrow: bool,
+) -> Tuple[bytes, str]:
+    rows, meta = _page(_select_columns(table, params), params)
+    meta = {"name": name, "data_version": version, **meta, "columns": list(rows.columns)}
+    if arrow:
+        return _arrow_body(rows, meta), ARROW_TYPE
+    return _json_body(meta, rows), JSON_TYPE
+
+
+def _route(path: str, params: Dict[str, str], store: ApiStore, version: str, arrow: bool) -> Tuple[bytes, str]:
+    parts = [p for p in path.split("/") if p]
+    if parts == ["health"]:
+        return _json_body({"status": "ok", "data_version": version}), JSON_TYPE
+    if parts == ["rollups"]:
+        return _json_body({"data_version": version, "rollups": store.rollup_names()}), JSON_TYPE
+    if len(parts) == 2 and parts[0] == "rollups":
+        table = _filter_dates(store.rollup(parts[1], version), params)
+        return _table_response(parts[1], table, params, version, arrow)
+    if parts == ["rfm"]:
+        table = store.rfm(version)
+        if params.get("segment"):
+            table = table[table["Segment"] == params["segment"]]
+        return _table_response("rfm", table, params, version, arrow)
+    if parts == ["forecast"]:
+        periods = _int_param(params, "periods", DEFAULT_FORECAST_PERIODS, 1, MAX_FORECAST_PERIODS)
+        return _table_response("forecast", store.forecast(periods, version), params, version, arrow)
+    raise ApiError(404, f"No route for {path!r}; try /health, /rollups, /rollups/<name>, /rfm or /forecast")
+
+
+def handle_request(method: str, target: str, headers: Dict[str, str], store: ApiStore) -> Response:
+    """
+    Answer one request. Pure with respect to the connection, so it can be
+    tested without a socket and run off the event loop.
+
+    Args:
+        method: HTTP method.
+        target: request target (path and query string).
+        headers: request headers with lower-case names.
+        store: ApiStore to read from.
+    Returns:
+        Response with an uncompressed or gzip-compressed body.
+    """
+    url = urlsplit(target)
+    params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+    base_headers = {"Cache-Control": "no-cache", "Vary": "Accept, Accept-Encoding"}
+    try:
+        if method not in ("GET", "HEAD"):
+            raise ApiError(405, f"Method {method} not allowed; the API is read-only")
+        arrow = _wants_arrow(params, headers)
+        # the ETag and the body come from the same data version; if the files
+        # change while the body is computed, start over from the new version
+        for attempt in range(VERSION_RETRIES):
+            version = store.version(refresh=attempt > 0)
+            etag = _etag(version, url.path, params, arrow)
+            # conditional requests are answered before any table is touched
+            if _etag_matches(headers.get("if-none-match"), etag):
+                return Response(304, {**base_headers, "ETag": etag})
+            try:
+                body, content_type = _route(url.path, params, store, version, arrow)
+                break
+            except VersionChanged:
+                logger.info(f"Data changed while answering {target}; retrying")
+        else:
+            raise ApiError(503, "Data is being updated; retry shortly")
+        response = Response(200, {**base_headers, "ETag": etag, "Content-Type": content_type}, body)
+    except ApiError as e:
+        response = Response(e.status, {"Content-Type": JSON_TYPE}, _json_body({"error": str(e)}))
+        if e.status == 405:
+            response.headers["Allow"] = "GET, HEAD"
+    except Exception as e:
+        logger.exception(f"Failed to handle {method} {target}: {e}")
+        response = Response(500, {"Content-Type": JSON_TYPE}, _json_body({"error": "internal error"}))
+
+    if len(response.body) >= MIN_GZIP_BYTES and "gzip" in headers.get("accept-encoding", ""):
+        response.body = gzip.compress(response.body, compresslevel=6)
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+# --- Async HTTP/1.1 server ---
+
+def _parse_head(head: bytes) -> Tuple[str, str, str, Dict[str, str]]:
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, version = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+def _content_length(headers: Dict[str, str]) -> int:
+    raw = headers.get("content-length", "").strip() or "0"
+    if not raw.isdigit():
+        raise ValueError(f"Invalid Content-Length {raw!r}")
+    length = int(raw)
+    if length > MAX_BODY_BYTES:
+        raise ValueError(f"Content-Length {length} exceeds {MAX_BODY_BYTES} bytes")
+    return length
+
+
+def _serialize(response: Response, keep_alive: bool, head_only: bool) -> bytes:
+    headers = {
+        **response.headers,
+        "Content-Length": str(len(response.body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+        "Server": "mrip-api",
+    }
+    lines = [f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}"]
+    lines += [f"{k}: {v}" for k, v in headers.items()]
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+    return head if head_only or response.status == 304 else head + response.body
+
+
+async def _serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, store: ApiStore) -> None:
+    """Serve requests on one connection until the client closes it or goes idle."""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_SECONDS)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                break
+            try:
+                method, target, http_version, headers = _parse_head(head[:-4])
+                body_length = _content_length(headers)
+            except ValueError:
+                writer.write(_serialize(Response(400, {}, b""), keep_alive=False, head_only=False))
+                break
+            if body_length:
+                try:
+                    await reader.readexactly(body_length)  # ignored request body
+                except asyncio.IncompleteReadError:
+                    break
+
+            # table computation may take a while on a new data version; keep the loop free
+            response = await loop.run_in_executor(None, handle_request, method, target, headers, store)
+            connection = headers.get("connection", "").lower()
+            keep_alive = connection == "keep-alive" if http_version == "HTTP/1.0" else connection != "close"
+            writer.write(_serialize(response, keep_alive, head_only=method == "HEAD"))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, store: Optional[ApiStore] = None):
+    """Start the API server and return the asyncio.Server (port 0 picks a free port)."""
+    store = store or ApiStore()
+    return await asyncio.start_server(
+        lambda r, w: _serve_connection(r, w, store), host, port, limit=MAX_HEADER_BYTES,
+    )
+
+
+async def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, data_dir: Path = DATA_DIR) -> None:
+    server = await start_server(host, port, ApiStore(data_dir))
+    logger.info(f"Serving {data_dir} on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve ETL outputs over a read-only HTTP API.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.data_dir))
+    except KeyboardInterrupt:
+        logger.info("API server stopped.")
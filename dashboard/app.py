@@ -1,16 +1,31 @@
 # dashboard/app.py
 
 import streamlit as st
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import logging
+import os
+import threading
 from typing import List, Dict, Any, Optional, Tuple
 
 # Assuming your models are structured to be imported like this
 # It's good practice for model functions to accept DataFrames and return DataFrames or relevant types
-from models.attribution import linear_attribution, time_decay_attribution
-from models.rfm_segmentation import calculate_rfm
+from models.attribution import linear_attribution, time_decay_attribution, markov_attribution
+from models.rfm_segmentation import calculate_rfm, assign_rfm_scores
 from models.roi_forecast import forecast_roi # Assuming prepare_time_series is internal or called by forecast_roi
+from models.cohort_analysis import (build_cohorts, update_cohorts, first_touch_channels, cohort_sizes,
+                                    retention_triangle, revenue_triangle, ltv_triangle)
+from models.budget_simulator import prepare_media_frame, fit_response_curves, optimize_budget, simulate_allocations
+from etl.ids import encode_ids, decode_ids
+from dashboard.downsample import DOWNSAMPLE_METHODS, downsample_frame
+from etl.result_cache import ResultCache, data_version
+from etl.ingest import load_all_data
+from etl.transform import transform_all
+from etl.timeline import build_timeline_index, load_timeline_index
+from etl.aggregates import AGGREGATE_SPECS, read_aggregate
+from etl.sketches import (SKETCH_SPECS, QUANTILE_SPECS, build_all_sketches, build_all_digests,
+                          hll_standard_error, load_sketches, load_digests)
 
 # --- Configuration & Constants ---
 st.set_page_config(
@@ -25,7 +40,14 @@ logger = logging.getLogger(__name__)
 
 # --- Constants ---
 DATA_DIR = Path("data/cleaned")
+TIMELINE_DIR = DATA_DIR / "timeline"
+SKETCH_DIR = DATA_DIR / "sketches"
 DEFAULT_FORECAST_PERIODS = 30
+BUDGET_CANDIDATES = 5000 # allocations scored per optimizer round
+CHART_PIXEL_WIDTH = 1200 # point budget for time-series charts (~1 point per pixel)
+RESULT_CACHE_MB = float(os.environ.get("MRIP_RESULT_CACHE_MB", 256)) # shared result cache cap
+LIVE_REFRESH_SECONDS = 30 # live panel refresh interval (new data from `python -m etl.watch`)
+AMOUNT_PERCENTILES = [10, 25, 50, 75, 90, 99]
 
 # Standard column names (use these in your ETL and throughout the app)
 COL_TIMESTAMP = "timestamp"
@@ -58,6 +80,7 @@ def load_individual_data(file_path: Path, date_cols: List[str]) -> Optional[pd.D
 def load_csv_with_timestamp(path: Path) -> pd.DataFrame:
     """
     Load a CSV, parse any date column, and unify it into 'timestamp'.
+    UUID id columns are encoded to uint64 pairs; use decode_ids() for display.
     """
     df = pd.read_csv(path)
     # find date columns
@@ -69,13 +92,16 @@ def load_csv_with_timestamp(path: Path) -> pd.DataFrame:
     df[date_cols[0]] = pd.to_datetime(df[date_cols[0]], errors="coerce")
     # rename it to our standard timestamp
     df = df.rename(columns={date_cols[0]: COL_TIMESTAMP})
+    # nullable halves so concatenated ad frames keep exact ids where absent
+    df = encode_ids(df, dtype="UInt64")
     logger.info(f"Parsed and renamed '{date_cols[0]}' to '{COL_TIMESTAMP}' for {path.name}")
     return df
 
 @st.cache_data(ttl=3600)
-def load_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
+def load_data(version: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Load and unify data from CSV files, renaming and merging as necessary.
+    `version` is the cleaned data's fingerprint, so new data reloads at once.
     Returns:
         Tuple containing the merged ad events DataFrame and the raw transactions DataFrame.
     """
@@ -102,7 +128,7 @@ def load_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
 
     # Debug: confirm columns & sample rows for transactions
     logger.info("Transactions columns after rename: %s", txn.columns.tolist())
-    st.sidebar.expander("🔍 Raw Transactions").dataframe(txn.head())
+    st.sidebar.expander("🔍 Raw Transactions").dataframe(decode_ids(txn.head()))
 
     # Merge purchase_amount into each ad frame
     def merge_ads(ad_df: pd.DataFrame) -> pd.DataFrame:
@@ -117,12 +143,129 @@ def load_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
 
     # Debug: confirm columns & sample rows for ads
     logger.info("Ads columns: %s", ads.columns.tolist())
-    st.sidebar.expander("🔍 Merged Ads").dataframe(ads.head())
+    st.sidebar.expander("🔍 Merged Ads").dataframe(decode_ids(ads.head()))
 
     return ads, txn
 
+@st.cache_data(ttl=3600)
+def load_spend(version: str) -> pd.DataFrame:
+    """
+    Load one row per ad/email send with its channel and cost. Unlike the
+    merged ads frame, sends are not repeated per matching transaction.
+    """
+    frames = []
+    for file_name, channel in (("facebook_ads.csv", "facebook"), ("google_ads.csv", "google"), ("email_campaigns.csv", "email")):
+        df = load_csv_with_timestamp(DATA_DIR / file_name)
+        df[COL_CHANNEL] = channel
+        frames.append(df[[COL_TIMESTAMP, COL_CHANNEL, COL_COST]])
+    return pd.concat(frames, ignore_index=True).dropna(subset=[COL_TIMESTAMP])
+
+def get_response_curves(version: str, revenue_df: pd.DataFrame):
+    """
+    Fit per-channel adstock/saturation curves once per data version; callers
+    cache the result by `version` so reruns never hash the input frames.
+    """
+    spend_matrix, revenue_ts = prepare_media_frame(load_spend(version), revenue_df)
+    return fit_response_curves(spend_matrix, revenue_ts)
+
+@st.cache_data(ttl=3600)
+def load_aggregates(version: str) -> Dict[str, pd.DataFrame]:
+    """Aggregate tables maintained by the ETL and the watch mode."""
+    tables = {name: read_aggregate(name, DATA_DIR) for name in AGGREGATE_SPECS}
+    return {name: table.reset_index() for name, table in tables.items() if table is not None}
+
+@st.cache_resource
+def load_timeline(version: str):
+    """
+    Memory-map the customer timeline kept up to date by the ETL and the
+    watch mode, building it from the cleaned CSVs only when neither has
+    written one yet.
+    """
+    timeline = load_timeline_index(TIMELINE_DIR)
+    if timeline is None:
+        logger.info("Building customer timeline from cleaned data...")
+        timeline = build_timeline_index(transform_all(load_all_data(DATA_DIR)))
+    return timeline
+
+@st.cache_resource
+def load_unique_sketches(version: str) -> Dict[str, Any]:
+    """
+    Distinct-count sketches per (day, source) written by the ETL, built from
+    the cleaned CSVs when the ETL has not produced them yet.
+    """
+    sketches = {name: load_sketches(SKETCH_DIR / f"{name}.npz") for name in SKETCH_SPECS}
+    if any(s is None for s in sketches.values()):
+        logger.info("Building distinct-count sketches from cleaned data...")
+        sketches = build_all_sketches(transform_all(load_all_data(DATA_DIR)))
+    return sketches
+
+@st.cache_resource
+def load_quantile_digests(version: str) -> Dict[str, Any]:
+    """Daily t-digests written by the ETL, built from the cleaned CSVs when missing."""
+    digests = {name: load_digests(SKETCH_DIR / f"{name}.npz") for name in QUANTILE_SPECS}
+    if any(d is None for d in digests.values()):
+        logger.info("Building quantile digests from cleaned data...")
+        digests = build_all_digests(transform_all(load_all_data(DATA_DIR)))
+    return digests
+
+@st.cache_resource
+def load_first_touch(version: str) -> pd.Series:
+    """First-touch channel per customer, from the timeline of this data version."""
+    return first_touch_channels(load_timeline(version))
+
+@st.cache_resource
+def get_cohort_states() -> Dict[str, Any]:
+    """
+    Running cohort states shared by every session, keyed by (frequency,
+    split by first-touch channel), with the data version, number and digest
+    of the transactions folded in.
+    """
+    return {"lock": threading.Lock(), "states": {}}
+
+def rows_digest(rows: pd.DataFrame) -> int:
+    """Order-independent digest of transaction rows, additive across batches."""
+    return int(pd.util.hash_pandas_object(rows, index=False).sum())
+
+def refresh_cohorts(states: Dict[Tuple[str, bool], Dict[str, Any]], txn: pd.DataFrame, freq: str,
+                    by_channel: bool, version: str):
+    """
+    Bring the running cohort state for (freq, by_channel) up to `version`;
+    call with the cohort lock held.
+
+    Rows appended since the last version are folded in with `update_cohorts`.
+    The state is rebuilt instead when the rows already folded in have changed
+    (compared by digest) or when the new rows predate their customers'
+    cohorts, which `update_cohorts` rejects without modifying the state.
+    """
+    entry = states.get((freq, by_channel))
+    if entry is not None and entry["version"] == version:
+        return entry["state"]
+    first_touch = load_first_touch(version) if by_channel else None
+    rows = txn[[COL_CUSTOMER_ID, COL_TIMESTAMP, COL_PURCHASE_AMOUNT]]
+    state = None
+    if entry is not None and len(rows) >= entry["rows"] and rows_digest(rows.iloc[:entry["rows"]]) == entry["digest"]:
+        appended = rows.iloc[entry["rows"]:]
+        try:
+            state = update_cohorts(entry["state"], appended, first_touch, date_col=COL_TIMESTAMP,
+                                   amount_col=COL_PURCHASE_AMOUNT)
+            digest = (entry["digest"] + rows_digest(appended)) % 2**64
+        except ValueError as e:
+            logger.info(f"Rebuilding {freq} cohorts: {e}")
+    if state is None:
+        state = build_cohorts(rows, freq, first_touch, date_col=COL_TIMESTAMP, amount_col=COL_PURCHASE_AMOUNT)
+        digest = rows_digest(rows)
+    states[(freq, by_channel)] = {"state": state, "version": version, "rows": len(rows), "digest": digest}
+    return state
+
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    """One result cache shared by every session of this server process."""
+    return ResultCache(max_bytes=int(RESULT_CACHE_MB * 2**20))
+
 # --- Main App Logic ---
-ads, txn = load_data()
+current_data_version = data_version(DATA_DIR)
+ads, txn = load_data(current_data_version)
+timeline = load_timeline(current_data_version)
 
 # Verify presence of customer_id in transactions
 if COL_CUSTOMER_ID not in txn.columns:
@@ -133,8 +276,13 @@ else:
 # --- Sidebar Controls ---
 st.sidebar.header("⚙️ Settings")
 
+live_mode = st.sidebar.toggle(
+    "🔴 Live updates",
+    help=f"Refresh the headline metrics every {LIVE_REFRESH_SECONDS}s with rows applied by the ETL watch mode."
+)
+
 # Attribution Model Selector
-attr_model_options = ["Linear", "Time Decay"]
+attr_model_options = ["Linear", "Time Decay", "Markov Chain"]
 attr_model_selected = st.sidebar.selectbox(
     "🎯 Attribution Model",
     attr_model_options,
@@ -164,6 +312,14 @@ if start_date > end_date:
     st.sidebar.warning("Start date cannot be after end date.")
     start_date = end_date # Or handle as an error
 
+# Chart downsampling method (applied server-side before plotting)
+chart_downsample = st.sidebar.selectbox(
+    "📉 Chart Downsampling",
+    DOWNSAMPLE_METHODS,
+    format_func=lambda m: {"lttb": "Largest-Triangle-Three-Buckets", "minmax": "Min/Max per bucket"}[m],
+    help="How long time series are reduced to the chart's pixel width before plotting."
+)
+
 # Apply Date Filter
 date_mask = (ads[COL_TIMESTAMP].dt.date >= start_date) & (ads[COL_TIMESTAMP].dt.date <= end_date)
 filtered_data = ads.loc[date_mask].copy()
@@ -196,14 +352,59 @@ if filtered_data.empty:
     st.info("Please select filters in the sidebar to see the analysis.")
     st.stop()
 
+# Headline KPIs from the incrementally maintained aggregate tables. In live
+# mode only this fragment reruns on a timer, re-reading the data version, so
+# the rest of the page stays interactive between refreshes.
+@st.fragment(run_every=LIVE_REFRESH_SECONDS if live_mode else None)
+def headline_panels() -> None:
+    version = data_version(DATA_DIR) if live_mode else current_data_version
+    aggregates = load_aggregates(version)
+    if aggregates:
+        kpi_cols = st.columns(3)
+        spend_agg = aggregates.get("daily_channel_spend")
+        revenue_agg = aggregates.get("daily_revenue")
+        if spend_agg is not None:
+            in_range = (spend_agg["date"].dt.date >= start_date) & (spend_agg["date"].dt.date <= end_date)
+            in_range &= spend_agg[COL_CHANNEL].str.lower().isin(selected_channels)
+            kpi_cols[0].metric("Spend", f"${spend_agg.loc[in_range, 'spend'].sum():,.2f}")
+        if revenue_agg is not None:
+            in_range = (revenue_agg["date"].dt.date >= start_date) & (revenue_agg["date"].dt.date <= end_date)
+            kpi_cols[1].metric("Revenue", f"${revenue_agg.loc[in_range, 'revenue'].sum():,.2f}")
+            kpi_cols[2].metric("Transactions", f"{int(revenue_agg.loc[in_range, 'transactions'].sum()):,}")
+
+    # Unique reach: merged HyperLogLog sketches, no rescan of the raw rows
+    unique_sketches = load_unique_sketches(version)
+    if unique_sketches:
+        hll_error = hll_standard_error()
+        reach_cols = st.columns(3)
+        for col, (name, label) in zip(reach_cols, [
+            ("visit_customers", "Unique Visitors"),
+            ("visit_sessions", "Unique Sessions"),
+            ("purchasing_customers", "Unique Purchasers"),
+        ]):
+            if name in unique_sketches:
+                col.metric(
+                    f"{label} (approx.)",
+                    f"{unique_sketches[name].estimate(start_date, end_date):,.0f}",
+                    help=f"HyperLogLog estimate, ±{hll_error:.1%} standard error.",
+                )
+        if "visit_customers" in unique_sketches:
+            with st.expander("Unique visitors by traffic source"):
+                st.bar_chart(unique_sketches["visit_customers"].estimate_by_group(start_date, end_date).round())
+
+headline_panels()
+
 # Attribution Section
 st.header("💰 Attribution & ROI by Channel")
 # Note: The attribution models need to correctly handle the `timestamp` (ad date)
 # and `txn_purchase_date` (transaction date) from the `filtered_data`.
 # They should also handle `purchase_amount`.
 
-# Caching for attribution results
-@st.cache_data
+# Results are cached by query key (data version + filters + model), not by
+# hashing the filtered frame, so a repeat query costs only the key lookup.
+result_cache = get_result_cache()
+query_key = (current_data_version, start_date, end_date, tuple(selected_channels))
+
 def get_attribution_results(df: pd.DataFrame, model_name: str) -> pd.DataFrame:
     logger.info(f"Calculating attribution with {model_name} model...")
     # Ensure attribution models are robust to NaNs in purchase_amount or txn_purchase_date
@@ -217,13 +418,40 @@ def get_attribution_results(df: pd.DataFrame, model_name: str) -> pd.DataFrame:
         # Example output columns: channel, timestamp (of ad), cost, attributed_revenue
     elif model_name == "Time Decay":
         attr_df = time_decay_attribution(df.copy())
+    elif model_name == "Markov Chain":
+        # Channel shares from journey removal effects, spread over each channel's
+        # rows in proportion to purchase_amount so the total revenue is kept
+        markov = markov_attribution(timeline, start=start_date, end=end_date)
+        shares = markov.assign(channel=markov["channel"].str.lower()).groupby("channel")["share"].sum()
+        attr_df = df.copy()
+        amount = attr_df[COL_PURCHASE_AMOUNT].fillna(0)
+        channel_shares = shares.reindex(attr_df[COL_CHANNEL].unique()).fillna(0)
+        if channel_shares.sum() > 0:
+            channel_revenue = channel_shares / channel_shares.sum() * amount.sum()
+            channel_amount = amount.groupby(attr_df[COL_CHANNEL]).sum()
+            scale = (channel_revenue / channel_amount.where(channel_amount > 0)).fillna(0)
+            attr_df['attributed_revenue'] = amount * attr_df[COL_CHANNEL].map(scale)
+        else:
+            attr_df['attributed_revenue'] = 0.0
     else:
         raise ValueError("Invalid attribution model selected")
+
+    # Calculate ROI: (Attributed Revenue - Cost) / Cost
+    # Done here so the cached (shared, read-only) result is already final
+    if 'cost' in attr_df.columns and 'attributed_revenue' in attr_df.columns:
+        attr_df['cost'] = pd.to_numeric(attr_df['cost'], errors='coerce').fillna(0)
+        attr_df['attributed_revenue'] = pd.to_numeric(attr_df['attributed_revenue'], errors='coerce').fillna(0)
+        # Avoid division by zero for ROI
+        cost = attr_df['cost'].where(attr_df['cost'] > 0)
+        attr_df["roi"] = ((attr_df['attributed_revenue'] - cost) / cost).fillna(0)
     logger.info(f"Attribution calculation complete. Shape: {attr_df.shape}")
     return attr_df
 
 try:
-    attribution_df = get_attribution_results(filtered_data, attr_model_selected)
+    attribution_df = result_cache.get_or_compute(
+        query_key + ("attribution", attr_model_selected),
+        lambda: get_attribution_results(filtered_data, attr_model_selected)
+    )
 
     # Verify presence of attributed_revenue
     if 'attributed_revenue' not in attribution_df.columns:
@@ -234,18 +462,8 @@ try:
     if attribution_df.empty:
         st.warning("Attribution results are empty. Check data and model logic.")
     else:
-        # Calculate ROI: (Attributed Revenue - Cost) / Cost
-        # Ensure 'cost' and 'attributed_revenue' are present and numeric
+        # Ensure 'cost' and 'attributed_revenue' are present (made numeric, with ROI, by get_attribution_results)
         if 'cost' in attribution_df.columns and 'attributed_revenue' in attribution_df.columns:
-            attribution_df['cost'] = pd.to_numeric(attribution_df['cost'], errors='coerce').fillna(0)
-            attribution_df['attributed_revenue'] = pd.to_numeric(attribution_df['attributed_revenue'], errors='coerce').fillna(0)
-            
-            # Avoid division by zero for ROI
-            attribution_df["roi"] = attribution_df.apply(
-                lambda row: (row["attributed_revenue"] - row["cost"]) / row["cost"] if row["cost"] > 0 else 0,
-                axis=1
-            )
-            
             # Display ROI by channel
             # Group by channel and sum up cost and revenue to show aggregate ROI
             summary_roi = attribution_df.groupby(COL_CHANNEL).agg(
@@ -270,7 +488,10 @@ try:
             # Pivot for plotting multiple lines
             pivot_attr = attribution_df.groupby([COL_TIMESTAMP, COL_CHANNEL])['attributed_revenue'].sum().unstack(fill_value=0)
             if not pivot_attr.empty:
-                st.line_chart(pivot_attr[selected_channels], use_container_width=True)
+                st.line_chart(
+                    downsample_frame(pivot_attr[selected_channels], CHART_PIXEL_WIDTH, chart_downsample),
+                    use_container_width=True
+                )
             else:
                 st.info("No attributed revenue data to plot for the selected channels and time.")
 
@@ -289,16 +510,84 @@ try:
         logger.error(f"Column '{COL_CUSTOMER_ID}' not found in transactions before RFM calculation.")
     else:
         logger.info(f"Column '{COL_CUSTOMER_ID}' successfully found in transactions before RFM calculation.")
-    rfm = calculate_rfm(txn)   # txn has customer_id & purchase_amount & timestamp
-    st.dataframe(rfm)
+    rfm = calculate_rfm(txn, timeline=timeline)   # per-customer runs of the timeline index
+    rfm = assign_rfm_scores(rfm)   # quintile cutpoints from merged t-digests
+    seg_col, table_col = st.columns([1, 2])
+    with seg_col:
+        st.subheader("Segments")
+        st.bar_chart(rfm["Segment"].value_counts())
+    with table_col:
+        st.dataframe(rfm)
+
+    amount_digests = load_quantile_digests(current_data_version).get("purchase_amount")
+    if amount_digests is not None:
+        st.subheader("Purchase Amount Percentiles")
+        amount_digest = amount_digests.digest(start_date, end_date)
+        if amount_digest.count:
+            percentiles = amount_digest.quantile(np.array(AMOUNT_PERCENTILES) / 100)
+            st.dataframe(pd.DataFrame(
+                {"purchase_amount": percentiles},
+                index=[f"p{p}" for p in AMOUNT_PERCENTILES],
+            ).T.style.format("${:,.2f}"))
+            st.caption(f"Approximate (t-digest) over {amount_digest.count:,.0f} purchases in the selected date range.")
+        else:
+            st.info("No purchases in the selected date range.")
 except Exception as e:
     display_error(f"'{COL_CUSTOMER_ID}' column not found. Cannot perform RFM segmentation.")
 
+# --- Cohort Analysis ---
+st.header("📅 Cohort Retention & LTV")
+cohort_cols = st.columns(3)
+cohort_freq = cohort_cols[0].radio("Cohort period", ["M", "W"], horizontal=True,
+                                   format_func=lambda f: {"M": "Monthly", "W": "Weekly"}[f])
+cohort_by_channel = cohort_cols[1].checkbox("Split by first-touch channel")
+cohort_metric = cohort_cols[2].selectbox("Metric", ["Retention", "Cumulative revenue", "LTV per customer"])
+
+# Cohort states are kept across reruns; rows appended by the watch mode are
+# folded in incrementally instead of rebuilding from the full history.
+cohort_cache = get_cohort_states()
+with cohort_cache["lock"]:
+    cohort_state = refresh_cohorts(cohort_cache["states"], txn, cohort_freq, cohort_by_channel,
+                                   current_data_version)
+    if cohort_metric == "Retention":
+        triangle, cell_format = retention_triangle(cohort_state), "{:.1%}"
+    elif cohort_metric == "Cumulative revenue":
+        triangle, cell_format = revenue_triangle(cohort_state), "${:,.0f}"
+    else:
+        triangle, cell_format = ltv_triangle(cohort_state), "${:,.2f}"
+    sizes = cohort_sizes(cohort_state)
+
+if triangle.empty:
+    st.info("No transactions available for cohort analysis.")
+else:
+    date_format = "%Y-%m" if cohort_freq == "M" else "%Y-%m-%d"
+    triangle = triangle.rename(index=lambda d: d.strftime(date_format) if isinstance(d, pd.Timestamp) else d,
+                               columns=str)
+    triangle.insert(0, "customers", sizes.to_numpy())
+    st.dataframe(triangle.style.format(cell_format, na_rep="", subset=triangle.columns[1:]),
+                 use_container_width=True)
+    st.caption(f"{cohort_state.n_customers:,} customers in {len(sizes):,} cohorts; "
+               f"columns are {'months' if cohort_freq == 'M' else 'weeks'} since first purchase.")
+
+# --- Customer Drilldown ---
+st.header("🧭 Customer Drilldown")
+drill_customers = timeline.customer_ids()
+if len(drill_customers) == 0:
+    st.info("No customer events available for drilldown.")
+else:
+    drill_customer = st.selectbox("Customer", drill_customers.tolist())
+    customer_events = timeline.events(drill_customer)
+    is_purchase = customer_events["event"] == "transaction"
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Events", f"{len(customer_events):,}")
+    col2.metric("Purchases", f"{int(is_purchase.sum()):,}")
+    col3.metric("Revenue", f"${customer_events.loc[is_purchase, 'amount'].sum():,.2f}")
+    st.dataframe(customer_events, use_container_width=True)
+
 # ROI Forecast (using attributed revenue)
 st.header("🔮 Combined ROI & Revenue Forecast")
 
-# Caching for forecast results
-@st.cache_data
+# Forecast results share the result cache, keyed like the attribution results
 def get_roi_forecast(attr_df: pd.DataFrame, periods: int) -> Optional[Tuple[pd.Series, pd.Series]]:
     logger.info("Preparing data and forecasting ROI/Revenue...")
     if 'attributed_revenue' not in attr_df.columns or attr_df.empty:
@@ -328,14 +617,21 @@ def get_roi_forecast(attr_df: pd.DataFrame, periods: int) -> Optional[Tuple[pd.S
         return daily_revenue_ts, None # Return history, but no forecast
 
 if not attribution_df.empty:
-    historical_revenue, forecast_values = get_roi_forecast(attribution_df, periods=DEFAULT_FORECAST_PERIODS)
+    historical_revenue, forecast_values = result_cache.get_or_compute(
+        query_key + ("forecast", attr_model_selected, DEFAULT_FORECAST_PERIODS),
+        lambda: get_roi_forecast(attribution_df, periods=DEFAULT_FORECAST_PERIODS)
+    )
 
     if historical_revenue is not None and not historical_revenue.empty:
         st.subheader("Attributed Revenue: History & Forecast")
-        history_plot_df = historical_revenue.rename("Actual Revenue")
+        history_plot_df = downsample_frame(
+            historical_revenue.rename("Actual Revenue"), CHART_PIXEL_WIDTH, chart_downsample
+        )
         
         if forecast_values is not None and not forecast_values.empty:
-            forecast_plot_df = forecast_values.rename("Forecasted Revenue")
+            forecast_plot_df = downsample_frame(
+                forecast_values.rename("Forecasted Revenue"), CHART_PIXEL_WIDTH, chart_downsample
+            )
             combined_plot_df = pd.concat([history_plot_df, forecast_plot_df], axis=1)
         else:
             st.info("Forecast could not be generated. Displaying historical data only.")
@@ -348,12 +644,61 @@ else:
     st.info("Attribution results are not available, so forecasting cannot be performed.")
 
 
+# --- Budget Scenario Planner ---
+st.header("🧮 Budget Scenario Planner")
+try:
+    curves = result_cache.get_or_compute(
+        (current_data_version, "response_curves"),
+        lambda: get_response_curves(current_data_version, txn[[COL_TIMESTAMP, COL_PURCHASE_AMOUNT]])
+    )
+    current_budget = float(curves.current_spend.sum())
+    if len(curves.channels) == 0 or not np.isfinite(current_budget) or current_budget <= 0:
+        st.info("No media spend recorded yet, so there is no budget to plan.")
+    else:
+        total_budget = st.slider(
+            "Total daily budget ($)",
+            min_value=0.0,
+            max_value=max(round(3 * current_budget, -1), 10.0),
+            value=max(round(current_budget, -1), 10.0),
+            step=10.0,
+            help="Daily media budget to split across channels."
+        )
+        if total_budget <= 0:
+            st.info("Choose a budget above $0 to see a recommended allocation.")
+        else:
+            plan = optimize_budget(curves, total_budget, n_candidates=BUDGET_CANDIDATES)
+            current_revenue = simulate_allocations(curves, curves.current_spend[None])[0]
+            planned_revenue = curves.intercept + plan["expected_revenue"].sum()
+
+            col1, col2 = st.columns(2)
+            col1.metric("Expected daily revenue (recommended)", f"${planned_revenue:,.2f}",
+                        delta=f"{planned_revenue - current_revenue:,.2f} vs current mix")
+            col2.metric("Response model fit (R²)", f"{curves.r2:.2f}")
+
+            plan.insert(0, "current_spend", curves.current_spend)
+            st.dataframe(plan.style.format({
+                "current_spend": "${:,.2f}",
+                "spend": "${:,.2f}",
+                "share": "{:.1%}",
+                "expected_revenue": "${:,.2f}"
+            }), use_container_width=True)
+except Exception as e:
+    display_error(f"Failed to run budget scenarios: {e}")
+
 # Raw Data Expander
 with st.expander("📂 Show Filtered & Merged Data Sample", expanded=False):
     if not filtered_data.empty:
-        st.dataframe(filtered_data.head(100), use_container_width=True)
+        st.dataframe(decode_ids(filtered_data.head(100)), use_container_width=True)
         st.caption(f"Displaying the first 100 rows of the {len(filtered_data)} filtered rows.")
     else:
         st.caption("No data to display.")
 
-logger.info("Dashboard rendering complete.")
\ No newline at end of file
+# Result cache debug panel
+with st.sidebar.expander("🐞 Result Cache", expanded=False):
+    cache_stats = result_cache.stats()
+    st.write(f"Hits: {cache_stats['hits']:,} · Misses: {cache_stats['misses']:,} · Hit rate: {cache_stats['hit_rate']:.0%}")
+    st.write(f"Entries: {cache_stats['entries']:,} · Evictions: {cache_stats['evictions']:,}")
+    st.progress(min(cache_stats['size_mb'] / cache_stats['max_mb'], 1.0),
+                text=f"{cache_stats['size_mb']:.1f} / {cache_stats['max_mb']:.0f} MB")
+
+logger.info("Dashboard rendering complete.")
@@ -0,0 +1,111 @@
+# dashboard/downsample.py
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+
+def minmax_indices(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """
+    Indices of the minimum and maximum of `y` in each of `n_buckets`
+    equal-width buckets, plus the first and last point. Every bucket is
+    reduced in a single padded 2-D argmin/argmax, so peaks always survive.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_buckets <= 0 or n <= 2 * n_buckets:
+        return np.arange(n)
+    width = -(-n // n_buckets)  # ceil division
+    padded = np.full(width * n_buckets, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(n_buckets, width)
+    valid = ~np.isnan(blocks).all(axis=1)  # trailing buckets may be all padding
+    starts = np.arange(n_buckets)[valid] * width
+    lows = starts + np.nanargmin(blocks[valid], axis=1)
+    highs = starts + np.nanargmax(blocks[valid], axis=1)
+    return np.unique(np.concatenate([[0, n - 1], lows, highs]))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: keep the first and last point and, from
+    each of `n_out - 2` buckets, the point forming the largest triangle with
+    the previously kept point and the next bucket's average. Bucket averages
+    and triangle areas are array operations; only the bucket walk is a loop.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # buckets over the interior points
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    # the bucket after the last interior bucket is the final point itself
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        area = np.abs(
+            (x[prev] - next_x[b]) * (y[lo:hi] - y[prev])
+            - (x[prev] - x[lo:hi]) * (next_y[b] - y[prev])
+        )
+        prev = lo + int(np.argmax(area))
+        picked[b + 1] = prev
+    return picked
+
+
+def _x_values(index: pd.Index) -> np.ndarray:
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype(float)
+    if pd.api.types.is_numeric_dtype(index):
+        return index.to_numpy(dtype=float)
+    return np.arange(len(index), dtype=float)
+
+
+def downsample_frame(data, pixel_width: int, method: str = "lttb"):
+    """
+    Reduce a chart's Series/DataFrame to roughly one point per horizontal
+    pixel before it is sent to the browser.
+
+    Each column keeps its own shape-preserving points (LTTB) or bucket
+    extremes (min/max, two per bucket) within an equal share of
+    `pixel_width`; the union of kept rows is returned, in order.
+
+    Args:
+        data: Series or DataFrame indexed by the chart's x axis. Values
+            should be finite (fill gaps before downsampling).
+        pixel_width: chart width in pixels, i.e. the point budget.
+        method: 'lttb' or 'minmax'.
+    Returns:
+        The same type as `data`, with at most about `pixel_width` rows.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}'; expected one of {DOWNSAMPLE_METHODS}")
+    if len(data) <= pixel_width:
+        return data
+
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+    budget = max(pixel_width // max(frame.shape[1], 1), 4)
+    x = _x_values(frame.index)
+    keep = []
+    for col in frame.columns:
+        y = frame[col].to_numpy(dtype=float)
+        if method == "lttb":
+            keep.append(lttb_indices(x, y, budget))
+        else:
+            keep.append(minmax_indices(y, budget // 2))
+    rows = np.unique(np.concatenate(keep))
+    logger.info(f"Downsampled chart data from {len(data):,} to {len(rows):,} points ({method})")
+    return data.iloc[rows]
@@ -0,0 +1,77 @@
+# etl/aggregates.py
+
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Aggregate tables maintained from the cleaned datasets:
+#   name -> (source datasets, date column, group columns, {output: source column}, row-count column)
+AGGREGATE_SPECS = {
+    "daily_channel_spend": (
+        ("facebook_ads", "google_ads", "email_campaigns"),
+        "date", ["channel"], {"spend": "cost", "clicks": "clicks"}, "sends",
+    ),
+    "daily_revenue": (
+        ("customer_transactions",),
+        "purchase_date", [], {"revenue": "amount"}, "transactions",
+    ),
+}
+
+
+def aggregate_keys(name: str) -> list:
+    """Index columns of an aggregate table."""
+    return ["date"] + AGGREGATE_SPECS[name][2]
+
+
+def build_aggregates(data: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """
+    Compute every aggregate table that `data` contributes to.
+
+    The tables are plain sums and counts, so aggregates of two batches of
+    rows combine with `merge_aggregates`; this is what lets the watch mode
+    fold in new rows without recomputing from history.
+
+    Args:
+        data: transformed datasets (a full load or just a batch of new rows).
+    Returns:
+        dict of table name -> DataFrame indexed by the table's keys; tables
+        none of whose sources appear in `data` are omitted.
+    """
+    tables: Dict[str, pd.DataFrame] = {}
+    for name, (sources, date_col, groups, sums, count_col) in AGGREGATE_SPECS.items():
+        frames = [data[s] for s in sources if s in data and not data[s].empty]
+        if not frames:
+            continue
+        rows = pd.concat([f[[date_col] + groups + list(sums.values())] for f in frames], ignore_index=True)
+        rows["date"] = pd.to_datetime(rows[date_col]).dt.normalize()
+        table = rows.groupby(aggregate_keys(name)).agg(
+            **{out: (src, "sum") for out, src in sums.items()},
+            **{count_col: ("date", "size")},
+        )
+        tables[name] = table
+    return tables
+
+
+def merge_aggregates(current: Optional[pd.DataFrame], delta: pd.DataFrame) -> pd.DataFrame:
+    """Add a batch's aggregate rows into an existing aggregate table."""
+    if current is None or current.empty:
+        return delta.sort_index()
+    return current.add(delta, fill_value=0).astype(delta.dtypes.to_dict()).sort_index()
+
+
+def read_aggregate(name: str, clean_dir: Path) -> Optional[pd.DataFrame]:
+    """Read an aggregate table written by `write_aggregate`, or None."""
+    path = clean_dir / f"{name}.csv"
+    if not path.exists():
+        return None
+    return pd.read_csv(path, parse_dates=["date"]).set_index(aggregate_keys(name))
+
+
+def write_aggregate(table: pd.DataFrame, path: Path) -> None:
+    """Write an aggregate table (keys as leading columns) to `path`."""
+    table.reset_index().to_csv(path, index=False, date_format="%Y-%m-%d")
+    logger.info(f"Saved aggregate {path.name} ({len(table):,} rows)")
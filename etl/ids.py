@@ -0,0 +1,150 @@
+# etl/ids.py
+
+import numpy as np
+import pandas as pd
+import logging
+from typing import Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# UUID-valued identifier columns found across our raw files
+ID_COLS = ("ad_id", "email_id", "transaction_id", "session_id")
+
+# Suffixes of the two uint64 halves that replace an encoded id column
+HI_SUFFIX = "_hi"
+LO_SUFFIX = "_lo"
+
+_UUID_LEN = 36
+NIL_UUID = "00000000-0000-0000-0000-000000000000"  # parsed value of missing ids
+_DASH_POSITIONS = np.array([8, 13, 18, 23])
+_HEX_POSITIONS = np.setdiff1d(np.arange(_UUID_LEN), _DASH_POSITIONS)
+_NIBBLE_SHIFTS = np.arange(60, -1, -4, dtype=np.uint64)  # 16 nibbles per half
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8).astype(np.uint32)
+
+# Unicode code point -> nibble value, -1 for anything that is not a hex digit
+_HEX_LOOKUP = np.full(128, -1, dtype=np.int8)
+for _i, _c in enumerate("0123456789abcdef"):
+    _HEX_LOOKUP[ord(_c)] = _i
+    _HEX_LOOKUP[ord(_c.upper())] = _i
+
+
+def parse_uuids(values: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse canonical 36-character UUID strings into two uint64 halves.
+
+    Missing values (None, NaN, pd.NA) are parsed as the nil UUID, i.e. both
+    halves 0; use `pd.isna(values)` to tell them apart from a literal nil id.
+
+    Args:
+        values: Sequence of UUID strings (e.g. a DataFrame column).
+    Returns:
+        (hi, lo) uint64 arrays holding the first and last 8 bytes.
+    Raises:
+        ValueError: if any present value is not a canonical UUID string.
+    """
+    arr = np.asarray(values, dtype=object)
+    if arr.size == 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint64)
+    missing = pd.isna(arr)
+    arr = np.where(missing, NIL_UUID, arr).astype(str)
+
+    bad_len = np.char.str_len(arr) != _UUID_LEN
+    codes = arr.astype(f"U{_UUID_LEN}").view(np.uint32).reshape(-1, _UUID_LEN)
+    bad_dash = (codes[:, _DASH_POSITIONS] != ord("-")).any(axis=1)
+    hex_codes = codes[:, _HEX_POSITIONS]
+    nibbles = _HEX_LOOKUP[np.minimum(hex_codes, 127)]
+    bad_hex = (nibbles < 0).any(axis=1)
+
+    bad = bad_len | bad_dash | bad_hex
+    if bad.any():
+        first = arr[np.argmax(bad)]
+        raise ValueError(f"{int(bad.sum())} invalid UUID value(s), e.g. {first!r}")
+
+    nibbles = nibbles.astype(np.uint64)
+    hi = (nibbles[:, :16] << _NIBBLE_SHIFTS).sum(axis=1, dtype=np.uint64)
+    lo = (nibbles[:, 16:] << _NIBBLE_SHIFTS).sum(axis=1, dtype=np.uint64)
+    return hi, lo
+
+
+def format_uuids(hi: np.ndarray, lo: np.ndarray) -> np.ndarray:
+    """
+    Render uint64 halves back into canonical lowercase UUID strings.
+
+    Args:
+        hi: uint64 array of the first 8 bytes.
+        lo: uint64 array of the last 8 bytes.
+    Returns:
+        Array of 36-character UUID strings.
+    """
+    hi = np.asarray(hi, dtype=np.uint64)
+    lo = np.asarray(lo, dtype=np.uint64)
+    nibbles = np.concatenate(
+        [(hi[:, None] >> _NIBBLE_SHIFTS) & 0xF, (lo[:, None] >> _NIBBLE_SHIFTS) & 0xF],
+        axis=1,
+    )
+    codes = np.full((len(hi), _UUID_LEN), ord("-"), dtype=np.uint32)
+    codes[:, _HEX_POSITIONS] = _HEX_DIGITS[nibbles.astype(np.intp)]
+    return codes.view(f"U{_UUID_LEN}").ravel()
+
+
+def encode_ids(df: pd.DataFrame, dtype: str = "uint64") -> pd.DataFrame:
+    """
+    Replace every known UUID column with a pair of `<col>_hi`/`<col>_lo`
+    integer columns, keeping the original column position.
+
+    Missing ids are kept missing: a column with nulls is encoded with the
+    nullable "UInt64" dtype whatever `dtype` says, so `decode_ids` restores
+    them as None.
+
+    Args:
+        df: DataFrame possibly containing columns from ID_COLS.
+        dtype: Integer dtype of the halves; use the nullable "UInt64" when the
+            frame is going to be concatenated with frames lacking the column.
+    Returns:
+        DataFrame with id columns encoded.
+    """
+    for col in ID_COLS:
+        if col not in df.columns:
+            continue
+        hi, lo = parse_uuids(df[col])
+        missing = df[col].isna().to_numpy()
+        col_dtype = dtype
+        if missing.any():
+            col_dtype = "UInt64"
+            logger.warning(f"{int(missing.sum())} missing value(s) in id column '{col}'")
+        hi, lo = pd.array(hi, dtype=col_dtype), pd.array(lo, dtype=col_dtype)
+        if missing.any():
+            hi[missing] = pd.NA
+            lo[missing] = pd.NA
+        pos = df.columns.get_loc(col)
+        df = df.drop(columns=col)
+        df.insert(pos, col + HI_SUFFIX, hi)
+        df.insert(pos + 1, col + LO_SUFFIX, lo)
+        logger.info(f"Encoded id column '{col}' as 2x{col_dtype}")
+    return df
+
+
+def decode_ids(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Inverse of `encode_ids`: render `<col>_hi`/`<col>_lo` pairs back into a
+    single UUID string column. Missing values in nullable halves stay missing.
+
+    Args:
+        df: DataFrame possibly containing encoded id columns.
+    Returns:
+        DataFrame with id columns as strings.
+    """
+    for col in ID_COLS:
+        hi_col, lo_col = col + HI_SUFFIX, col + LO_SUFFIX
+        if hi_col not in df.columns or lo_col not in df.columns:
+            continue
+        present = df[hi_col].notna().to_numpy()
+        strings = np.full(len(df), None, dtype=object)
+        strings[present] = format_uuids(
+            df[hi_col].to_numpy(dtype=np.uint64, na_value=0)[present],
+            df[lo_col].to_numpy(dtype=np.uint64, na_value=0)[present],
+        )
+        pos = df.columns.get_loc(hi_col)
+        df = df.drop(columns=[hi_col, lo_col])
+        df.insert(pos, col, strings)
+    return df
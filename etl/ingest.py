@@ -3,7 +3,17 @@
 from pathlib import Path
 import pandas as pd
 import logging
-from typing import Dict
+import time
+from typing import Dict, List, Optional
+
+from etl.aggregates import AGGREGATE_SPECS
+
+try:  # optional: multi-threaded CSV parser
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
 
 # configure module-level logger
 logging.basicConfig(
@@ -14,54 +24,184 @@ logger = logging.getLogger(__name__)
 
 RAW_DATA_DIR = Path("data/raw")
 
+# Raw feed file patterns and the compression codec implied by each suffix
+RAW_PATTERNS = ("*.csv", "*.csv.gz", "*.csv.zst")
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+
+# Files named '<dataset>__<part>.csv' are extra partitions of '<dataset>'
+PARTITION_SEPARATOR = "__"
+
+# Size of the blocks pyarrow hands to its parser threads
+PYARROW_BLOCK_SIZE = 16 << 20
+
+# Fields pandas reads as missing by default; pyarrow is given the same list
+# so both engines return NaN for empty ids rather than ""
+NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+
+def detect_compression(file_path: Path) -> Optional[str]:
+    """Return the compression codec of a raw feed file, or None if plain."""
+    return COMPRESSION_SUFFIXES.get(file_path.suffix.lower())
+
+
+def dataset_name(file_path: Path) -> str:
+    """
+    Dataset key of a raw feed file: the filename without '.csv', any
+    compression suffix and any partition suffix
+    (e.g. 'facebook_ads__2024-05-01.csv.gz' -> 'facebook_ads').
+    """
+    name = file_path.name
+    if detect_compression(file_path):
+        name = name[: -len(file_path.suffix)]
+    name = name[:-4] if name.lower().endswith(".csv") else name
+    return name.split(PARTITION_SEPARATOR, 1)[0]
+
+
+def _read_pyarrow(file_path: Path, compression: Optional[str]) -> pd.DataFrame:
+    """Parse with pyarrow's multi-threaded reader, decompressing as a stream."""
+    with pa.input_stream(str(file_path), compression=compression) as stream:
+        table = pa_csv.read_csv(
+            stream,
+            read_options=pa_csv.ReadOptions(use_threads=True, block_size=PYARROW_BLOCK_SIZE),
+            convert_options=pa_csv.ConvertOptions(null_values=NULL_VALUES, strings_can_be_null=True),
+        )
+    return table.to_pandas()
+
+
+def _read_pandas(file_path: Path, compression: Optional[str]) -> pd.DataFrame:
+    """Parse with the pandas C parser, which also decompresses as a stream."""
+    return pd.read_csv(file_path, compression=compression)
 
-def load_csv(file_path: Path) -> pd.DataFrame:
+
+_READERS = {"pyarrow": _read_pyarrow, "pandas": _read_pandas}
+_PARSE_ERRORS = (pd.errors.ParserError,) + ((pa.ArrowInvalid,) if pa is not None else ())
+
+
+def resolve_engine(engine: str = "auto") -> str:
+    """
+    Pick the CSV engine: 'auto' prefers pyarrow when it is installed.
+
+    Raises:
+        ValueError: for an unknown engine name.
+        ImportError: if 'pyarrow' is requested but not installed.
+    """
+    if engine == "auto":
+        return "pyarrow" if pa is not None else "pandas"
+    if engine not in _READERS:
+        raise ValueError(f"Unknown CSV engine '{engine}'; expected one of {sorted(_READERS)} or 'auto'")
+    if engine == "pyarrow" and pa is None:
+        raise ImportError("engine='pyarrow' requires the pyarrow package")
+    return engine
+
+
+def load_csv(file_path: Path, engine: str = "auto") -> pd.DataFrame:
     """
     Load a single CSV into a DataFrame.
-    
+    Gzip (.csv.gz) and zstd (.csv.zst) files are decompressed on the fly.
+
     Args:
         file_path: Path to a CSV file.
+        engine: 'pyarrow', 'pandas' or 'auto' (pyarrow when installed).
     Returns:
         DataFrame of the CSV contents.
     Raises:
         FileNotFoundError: if the file does not exist.
         pd.errors.ParserError: if pandas fails to parse it.
+        pyarrow.ArrowInvalid: if pyarrow fails to parse it.
     """
     if not file_path.exists():
         logger.error(f"File not found: {file_path}")
         raise FileNotFoundError(f"No such file: {file_path}")
+    engine = resolve_engine(engine)
+    compression = detect_compression(file_path)
     try:
-        df = pd.read_csv(file_path)
-        logger.info(f"Loaded {file_path.name} ({len(df):,} rows)")
+        df = _READERS[engine](file_path, compression)
+        logger.info(f"Loaded {file_path.name} ({len(df):,} rows, engine={engine})")
         return df
-    except pd.errors.ParserError as e:
+    except _PARSE_ERRORS:
         logger.exception(f"Parsing failed for {file_path.name}")
         raise
 
 
-def load_all_data(raw_dir: Path = RAW_DATA_DIR) -> Dict[str, pd.DataFrame]:
+def list_raw_files(raw_dir: Path = RAW_DATA_DIR) -> List[Path]:
+    """All raw feed files in `raw_dir` matching RAW_PATTERNS, sorted by name."""
+    return sorted({p for pattern in RAW_PATTERNS for p in raw_dir.glob(pattern)})
+
+
+def load_all_data(raw_dir: Path = RAW_DATA_DIR, engine: str = "auto") -> Dict[str, pd.DataFrame]:
     """
-    Discover and load all CSV files in the raw data directory.
-    
+    Discover and load all CSV files (plain or compressed) in the raw data directory.
+
     Args:
         raw_dir: Directory containing raw CSVs.
+        engine: CSV engine passed to `load_csv`.
     Returns:
-        A dict mapping <basename> -> DataFrame, where basename is 
-        the filename without extension (e.g., 'facebook_ads').
+        A dict mapping <basename> -> DataFrame, where basename is
+        the filename without extension (e.g., 'facebook_ads'). Partition
+        files of the same dataset are concatenated in filename order.
+        Aggregate tables (AGGREGATE_SPECS) that the ETL writes next to the
+        cleaned datasets are skipped, so the cleaned directory loads too.
     """
-    data: Dict[str, pd.DataFrame] = {}
-    csv_files = list(raw_dir.glob("*.csv"))
-    
+    parts: Dict[str, List[pd.DataFrame]] = {}
+    csv_files = [p for p in list_raw_files(raw_dir) if dataset_name(p) not in AGGREGATE_SPECS]
+
     if not csv_files:
         logger.warning(f"No CSV files found in {raw_dir}")
-    
+
     for file_path in csv_files:
-        key = file_path.stem  # 'facebook_ads' instead of 'facebook_ads.csv'
-        data[key] = load_csv(file_path)
-    return data
+        key = dataset_name(file_path)  # 'facebook_ads' instead of 'facebook_ads.csv.gz'
+        parts.setdefault(key, []).append(load_csv(file_path, engine=engine))
+    return {
+        key: frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        for key, frames in parts.items()
+    }
+
+
+def benchmark_readers(file_path: Path, repeats: int = 3) -> pd.DataFrame:
+    """
+    Time every available CSV engine on one file.
+
+    Args:
+        file_path: Raw feed file (plain or compressed).
+        repeats: Timed runs per engine; the best run is reported.
+    Returns:
+        DataFrame with one row per engine: rows, best seconds, rows/s and
+        MB/s of on-disk (possibly compressed) input.
+    """
+    engines = ["pandas"] + (["pyarrow"] if pa is not None else [])
+    size_mb = file_path.stat().st_size / 1e6
+    results = []
+    for engine in engines:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            df = _READERS[engine](file_path, detect_compression(file_path))
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results.append({
+            "engine": engine,
+            "rows": len(df),
+            "seconds": best,
+            "rows_per_sec": len(df) / best,
+            "mb_per_sec": size_mb / best,
+        })
+    return pd.DataFrame(results)
 
 
 if __name__ == "__main__":
-    datasets = load_all_data()
-    for name, df in datasets.items():
-        logger.info(f"Dataset '{name}' shape: {df.shape}")
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load raw feeds or benchmark CSV readers.")
+    parser.add_argument("--benchmark", type=Path, help="raw feed file to benchmark every engine on")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(benchmark_readers(args.benchmark, repeats=args.repeats).to_string(index=False))
+    else:
+        datasets = load_all_data()
+        for name, df in datasets.items():
+            logger.info(f"Dataset '{name}' shape: {df.shape}")
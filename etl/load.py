@@ -3,7 +3,9 @@
 from pathlib import Path
 import pandas as pd
 import logging
-from typing import Dict
+from typing import Dict, Optional
+
+from etl.ids import decode_ids
 
 # configure logging
 logging.basicConfig(
@@ -15,48 +17,64 @@ logger = logging.getLogger(__name__)
 CLEANED_DATA_DIR = Path("data/cleaned")
 
 
-def ensure_clean_dir():
-    """Create the cleaned data directory if it doesn't exist."""
-    if not CLEANED_DATA_DIR.exists():
-        CLEANED_DATA_DIR.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Created directory: {CLEANED_DATA_DIR}")
+def ensure_clean_dir(out_dir: Optional[Path] = None) -> Path:
+    """Create the cleaned data directory if it doesn't exist, and return it."""
+    out_dir = out_dir or CLEANED_DATA_DIR
+    if not out_dir.exists():
+        out_dir.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Created directory: {out_dir}")
+    return out_dir
 
 
-def save_csv(df: pd.DataFrame, file_name: str) -> None:
+def save_csv(df: pd.DataFrame, file_name: str, out_dir: Optional[Path] = None) -> None:
     """
     Save a DataFrame to a CSV in the cleaned directory.
+    Encoded id columns are written back in their UUID string form.
 
     Args:
         df: DataFrame to save.
         file_name: Base name (with or without .csv) for the output file.
+        out_dir: Output directory; defaults to CLEANED_DATA_DIR.
     """
-    ensure_clean_dir()
+    out_dir = ensure_clean_dir(out_dir)
     # Ensure .csv extension
-    path = CLEANED_DATA_DIR / (file_name if file_name.endswith(".csv") else f"{file_name}.csv")
+    path = out_dir / (file_name if file_name.endswith(".csv") else f"{file_name}.csv")
     try:
-        df.to_csv(path, index=False)
+        decode_ids(df).to_csv(path, index=False)
         logger.info(f"Saved {path.name} ({len(df):,} rows)")
     except Exception as e:
         logger.exception(f"Failed to save {path.name}: {e}")
         raise
 
 
-def save_all_data(data: Dict[str, pd.DataFrame]) -> None:
+def save_all_data(data: Dict[str, pd.DataFrame], out_dir: Optional[Path] = None) -> None:
     """
     Save every DataFrame in `data` to the cleaned directory.
 
     Args:
         data: Dict mapping base filename (or key) to DataFrame.
+        out_dir: Output directory; defaults to CLEANED_DATA_DIR.
     """
     for key, df in data.items():
-        save_csv(df, key)
+        save_csv(df, key, out_dir)
 
 
 if __name__ == "__main__":
     from etl.ingest import load_all_data
     from etl.transform import transform_all
+    from etl.timeline import build_timeline_index, campaign_sends, save_campaign_sends, save_timeline_index
+    from etl.aggregates import build_aggregates, write_aggregate
+    from etl.sketches import build_all_sketches, save_sketches, build_all_digests, save_digests
 
     raw = load_all_data()
     clean = transform_all(raw)
     save_all_data(clean)
+    for name, table in build_aggregates(clean).items():
+        write_aggregate(table, CLEANED_DATA_DIR / f"{name}.csv")
+    for name, sketches in build_all_sketches(clean).items():
+        save_sketches(sketches, CLEANED_DATA_DIR / "sketches" / f"{name}.npz")
+    for name, digests in build_all_digests(clean).items():
+        save_digests(digests, CLEANED_DATA_DIR / "sketches" / f"{name}.npz")
+    save_campaign_sends(campaign_sends(clean), CLEANED_DATA_DIR / "timeline")
+    save_timeline_index(build_timeline_index(clean), CLEANED_DATA_DIR / "timeline")
     logger.info("All cleaned data files saved successfully.")
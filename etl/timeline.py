@@ -0,0 +1,448 @@
+# etl/timeline.py
+
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_DIR = Path("data/cleaned/timeline")
+
+# Event kinds, in the order they sort within the same timestamp
+EVENT_KINDS = ("visit", "touch", "transaction")
+EVENT_VISIT, EVENT_TOUCH, EVENT_TRANSACTION = range(len(EVENT_KINDS))
+
+# Datasets that carry paid/owned media touches, keyed by dataset name
+TOUCH_DATASETS = ("facebook_ads", "google_ads", "email_campaigns")
+
+# Per-event arrays persisted as one .npy file each
+_EVENT_ARRAYS = ("customer_id", "timestamp", "kind", "channel", "campaign_id", "amount")
+
+# Distinct campaign sends (campaign_id, date, channel) kept next to the
+# timeline, so new transactions are matched without re-reading the ad feeds
+SENDS_FILE = "sends.npz"
+_SEND_COLUMNS = ["campaign_id", "date", "channel"]
+
+# Loads that race a watch-mode update wait for the header to catch up
+LOAD_RETRIES = 20
+LOAD_RETRY_SECONDS = 0.05
+
+
+@dataclass
+class CustomerTimeline:
+    """
+    Every customer event sorted by (customer_id, timestamp, kind), CSR style:
+    the events of customer `c` are rows `offsets[c]:offsets[c + 1]` of the
+    per-event arrays. Customer ids are used directly as offsets indexes, so a
+    lookup is O(1) plus the length of that customer's timeline.
+    """
+    offsets: np.ndarray      # int64, len = max customer_id + 2
+    customer_id: np.ndarray  # int64
+    timestamp: np.ndarray    # datetime64[ns]
+    kind: np.ndarray         # int8, index into EVENT_KINDS
+    channel: np.ndarray      # int16, index into `channels` (-1 if none)
+    campaign_id: np.ndarray  # int64 (-1 if none)
+    amount: np.ndarray       # float64, purchase amount for transactions
+    channels: List[str]
+
+    def __len__(self) -> int:
+        return len(self.customer_id)
+
+    def customer_ids(self) -> np.ndarray:
+        """Ids of customers with at least one event."""
+        return np.flatnonzero(np.diff(self.offsets))
+
+    def span(self, customer_id: int) -> slice:
+        """Row slice of a customer's events (empty for unknown ids)."""
+        if customer_id < 0 or customer_id + 1 >= len(self.offsets):
+            return slice(0, 0)
+        return slice(int(self.offsets[customer_id]), int(self.offsets[customer_id + 1]))
+
+    def events(self, customer_id: int) -> pd.DataFrame:
+        """
+        Return one customer's timeline as a readable DataFrame.
+        """
+        rows = self.span(customer_id)
+        channel = self.channel[rows]
+        channel_names = np.array(self.channels + [None], dtype=object)
+        return pd.DataFrame({
+            "timestamp": self.timestamp[rows],
+            "event": np.array(EVENT_KINDS, dtype=object)[self.kind[rows]],
+            "channel": channel_names[channel],
+            "campaign_id": pd.Series(self.campaign_id[rows]).where(lambda c: c >= 0).astype("Int64"),
+            "amount": self.amount[rows],
+        })
+
+
+def _frame(customer_id, timestamp, kind, channel, campaign_id, amount) -> pd.DataFrame:
+    n = len(customer_id)
+    return pd.DataFrame({
+        "customer_id": np.asarray(customer_id, dtype=np.int64),
+        "timestamp": pd.to_datetime(timestamp).to_numpy(dtype="datetime64[ns]"),
+        "kind": np.full(n, kind, dtype=np.int8),
+        "channel": channel,
+        "campaign_id": np.asarray(campaign_id, dtype=np.int64),
+        "amount": np.asarray(amount, dtype=np.float64),
+    })
+
+
+def _campaign_touches(transactions: pd.DataFrame, ads: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ad rows carry no customer id, so a customer is taken to have been touched
+    by every send of a campaign they later purchased from, up to and including
+    the purchase day.
+    """
+    exposed = transactions[["customer_id", "campaign_id", "purchase_date"]].merge(
+        ads[["campaign_id", "date", "channel"]], on="campaign_id", how="inner"
+    )
+    exposed = exposed[exposed["date"] <= exposed["purchase_date"]]
+    return exposed.drop_duplicates(subset=["customer_id", "campaign_id", "date", "channel"])
+
+
+def _event_frames(data: Dict[str, pd.DataFrame], touches: Optional[pd.DataFrame]) -> List[pd.DataFrame]:
+    """Visit, touch and transaction event frames of transformed datasets."""
+    parts = []
+    visits = data.get("website_visits")
+    if visits is not None:
+        parts.append(_frame(
+            visits["customer_id"], visits["visit_date"], EVENT_VISIT,
+            visits["source"].to_numpy(dtype=object), np.full(len(visits), -1), np.zeros(len(visits)),
+        ))
+    if touches is not None and len(touches):
+        parts.append(_frame(
+            touches["customer_id"], touches["date"], EVENT_TOUCH,
+            touches["channel"].to_numpy(dtype=object), touches["campaign_id"], np.zeros(len(touches)),
+        ))
+    txn = data.get("customer_transactions")
+    if txn is not None:
+        parts.append(_frame(
+            txn["customer_id"], txn["purchase_date"], EVENT_TRANSACTION,
+            np.full(len(txn), None, dtype=object), txn["campaign_id"], txn["amount"],
+        ))
+    return parts
+
+
+def build_timeline_index(data: Dict[str, pd.DataFrame]) -> CustomerTimeline:
+    """
+    Join website visits, campaign touches and transactions into a CSR
+    customer timeline.
+
+    Args:
+        data: transformed datasets as returned by `transform_all`. Uses
+            'website_visits', 'customer_transactions' and, when present, the
+            datasets in TOUCH_DATASETS.
+    Returns:
+        CustomerTimeline over every customer seen in visits or transactions.
+    """
+    touches = None
+    txn = data.get("customer_transactions")
+    ads = [data[name] for name in TOUCH_DATASETS if name in data]
+    if txn is not None and ads:
+        touches = _campaign_touches(txn, pd.concat(ads, ignore_index=True))
+    parts = _event_frames(data, touches)
+    if not parts:
+        raise KeyError("Timeline needs 'website_visits' or 'customer_transactions'")
+
+    events = pd.concat(parts, ignore_index=True)
+    if (events["customer_id"] < 0).any():
+        raise ValueError("Timeline index requires non-negative integer customer ids")
+
+    channel_codes, channels = pd.factorize(events["channel"], sort=True)
+    customer_id = events["customer_id"].to_numpy()
+    timestamp = events["timestamp"].to_numpy()
+    kind = events["kind"].to_numpy()
+    order = np.lexsort((kind, timestamp, customer_id))
+
+    counts = np.bincount(customer_id, minlength=customer_id.max() + 1)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    timeline = CustomerTimeline(
+        offsets=offsets,
+        customer_id=customer_id[order],
+        timestamp=timestamp[order],
+        kind=kind[order],
+        channel=channel_codes[order].astype(np.int16),
+        campaign_id=events["campaign_id"].to_numpy()[order],
+        amount=events["amount"].to_numpy()[order],
+        channels=[str(c) for c in channels],
+    )
+    logger.info(
+        f"Built customer timeline: {len(timeline):,} events, "
+        f"{len(timeline.customer_ids()):,} customers"
+    )
+    return timeline
+
+
+def _span_rows(offsets: np.ndarray, customers: np.ndarray) -> np.ndarray:
+    """Row indexes of the events of `customers` (ids beyond the timeline have none)."""
+    known = customers[customers + 1 < len(offsets)]
+    starts, ends = offsets[known], offsets[known + 1]
+    starts, ends = starts[ends > starts], ends[ends > starts]
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # concatenated aranges: step 1 within a span, a jump to the next span's start between spans
+    lengths = ends - starts
+    steps = np.ones(int(lengths.sum()), dtype=np.int64)
+    steps[0] = starts[0]
+    steps[np.cumsum(lengths)[:-1]] = starts[1:] - ends[:-1] + 1
+    return np.cumsum(steps)
+
+
+def _new_touches(
+    timeline: CustomerTimeline,
+    delta: Dict[str, pd.DataFrame],
+    ads: Optional[pd.DataFrame],
+) -> Optional[pd.DataFrame]:
+    """
+    Campaign touches implied by a batch of new rows that the timeline does
+    not hold yet: new transactions against every ad send, and new ad sends
+    against the transactions already in the timeline.
+    """
+    new_ads = [delta[name] for name in TOUCH_DATASETS if name in delta]
+    all_ads = [df for df in [ads] + new_ads if df is not None and len(df)]
+    found = []
+    txn = delta.get("customer_transactions")
+    if txn is not None and all_ads:
+        found.append(_campaign_touches(txn, pd.concat(all_ads, ignore_index=True)))
+    if new_ads:
+        new_ads = pd.concat(new_ads, ignore_index=True)
+        is_txn = (np.asarray(timeline.kind) == EVENT_TRANSACTION) & np.isin(
+            timeline.campaign_id, new_ads["campaign_id"].unique())
+        old_txn = pd.DataFrame({
+            "customer_id": np.asarray(timeline.customer_id)[is_txn],
+            "campaign_id": np.asarray(timeline.campaign_id)[is_txn],
+            "purchase_date": np.asarray(timeline.timestamp)[is_txn],
+        })
+        found.append(_campaign_touches(old_txn, new_ads))
+    if not found:
+        return None
+
+    keys = ["customer_id", "campaign_id", "date", "channel"]
+    touches = pd.concat(found, ignore_index=True).drop_duplicates(subset=keys)
+    # drop touches the timeline already holds (e.g. a repeat purchase from a campaign)
+    rows = _span_rows(timeline.offsets, pd.unique(touches["customer_id"].to_numpy(dtype=np.int64)))
+    rows = rows[np.asarray(timeline.kind)[rows] == EVENT_TOUCH]
+    existing = pd.DataFrame({
+        "customer_id": np.asarray(timeline.customer_id)[rows],
+        "campaign_id": np.asarray(timeline.campaign_id)[rows],
+        "date": np.asarray(timeline.timestamp)[rows],
+        "channel": np.array(timeline.channels, dtype=object)[np.asarray(timeline.channel)[rows]],
+    })
+    touches = touches.astype({"customer_id": np.int64, "campaign_id": np.int64})
+    touches["date"] = pd.to_datetime(touches["date"]).astype("datetime64[ns]")
+    merged = touches.merge(existing, on=keys, how="left", indicator=True)
+    return merged.loc[merged["_merge"] == "left_only", keys]
+
+
+def extend_timeline_index(
+    timeline: CustomerTimeline,
+    delta: Dict[str, pd.DataFrame],
+    ads: Optional[pd.DataFrame] = None,
+) -> CustomerTimeline:
+    """
+    Fold a batch of new rows into a timeline without rebuilding it.
+
+    Only the customers in the batch are re-sorted; every other customer's
+    events are block-copied to their shifted offsets, so the cost is one
+    pass over the existing arrays plus a sort of the affected customers.
+    The result equals `build_timeline_index` over old and new rows
+    (events with identical keys keep old-before-new order).
+
+    Args:
+        timeline: existing timeline (may be memory-mapped; not modified).
+        delta: transformed new rows per dataset, as for `build_timeline_index`.
+        ads: the campaign sends already behind `timeline` (the touch
+            datasets' rows or their `campaign_sends` table), used to derive
+            touches of new transactions.
+    Returns:
+        A new CustomerTimeline.
+    """
+    parts = _event_frames(delta, _new_touches(timeline, delta, ads))
+    if not parts:
+        return timeline
+    events = pd.concat(parts, ignore_index=True)
+    if events.empty:
+        return timeline
+    if (events["customer_id"] < 0).any():
+        raise ValueError("Timeline index requires non-negative integer customer ids")
+
+    # channel vocabulary stays sorted, so codes match a full rebuild
+    names = [c for c in pd.unique(events["channel"].dropna()) if c not in timeline.channels]
+    channels = sorted(timeline.channels + [str(c) for c in names])
+    remap = np.append(pd.Index(channels).get_indexer(timeline.channels), -1).astype(np.int16)
+    old_channel = remap[np.asarray(timeline.channel)]  # code -1 picks the trailing -1
+    new_channel = pd.Index(channels).get_indexer(events["channel"]).astype(np.int16)
+
+    old_offsets = np.asarray(timeline.offsets)
+    new_customer = events["customer_id"].to_numpy()
+    n_customers = max(len(old_offsets) - 1, int(new_customer.max()) + 1)
+    counts = np.zeros(n_customers, dtype=np.int64)
+    counts[:len(old_offsets) - 1] = np.diff(old_offsets)
+    counts += np.bincount(new_customer, minlength=n_customers)
+    offsets = np.zeros(n_customers + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    old = {
+        "customer_id": np.asarray(timeline.customer_id),
+        "timestamp": np.asarray(timeline.timestamp),
+        "kind": np.asarray(timeline.kind),
+        "channel": old_channel,
+        "campaign_id": np.asarray(timeline.campaign_id),
+        "amount": np.asarray(timeline.amount),
+    }
+    new = {
+        "customer_id": new_customer,
+        "timestamp": events["timestamp"].to_numpy(dtype="datetime64[ns]"),
+        "kind": events["kind"].to_numpy(),
+        "channel": new_channel,
+        "campaign_id": events["campaign_id"].to_numpy(),
+        "amount": events["amount"].to_numpy(),
+    }
+
+    # old rows move by their customer's offset shift ...
+    shift = offsets[:len(old_offsets) - 1] - old_offsets[:-1]
+    dest_old = np.arange(len(timeline), dtype=np.int64) + shift[old["customer_id"]]
+    # ... and the affected customers' old and new rows are re-sorted together,
+    # overwriting their whole (grown) ranges
+    rows = _span_rows(old_offsets, pd.unique(new_customer))
+    block = {name: np.concatenate([old[name][rows], new[name]]) for name in _EVENT_ARRAYS}
+    order = np.lexsort((block["kind"], block["timestamp"], block["customer_id"]))
+    block = {name: values[order] for name, values in block.items()}
+    block_customer = block["customer_id"]
+    dest_block = offsets[block_customer] + (
+        np.arange(len(block_customer)) - np.searchsorted(block_customer, block_customer, side="left"))
+
+    arrays = {}
+    for name in _EVENT_ARRAYS:
+        out = np.empty(offsets[-1], dtype=old[name].dtype)
+        out[dest_old] = old[name]
+        out[dest_block] = block[name]
+        arrays[name] = out
+    extended = CustomerTimeline(offsets=offsets, channels=channels, **arrays)
+    logger.info(
+        f"Extended customer timeline by {len(events):,} events "
+        f"({len(pd.unique(new_customer)):,} customers) to {len(extended):,}"
+    )
+    return extended
+
+
+def campaign_sends(data: Dict[str, pd.DataFrame], sends: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Distinct (campaign_id, date, channel) sends of the touch datasets in
+    `data`, merged into an existing send table when one is given. This is
+    all `_campaign_touches` needs from the ad rows.
+    """
+    frames = [data[name][_SEND_COLUMNS] for name in TOUCH_DATASETS if name in data]
+    if sends is not None:
+        frames.insert(0, sends)
+    if not frames:
+        return pd.DataFrame({
+            "campaign_id": np.zeros(0, dtype=np.int64),
+            "date": np.zeros(0, dtype="datetime64[ns]"),
+            "channel": np.zeros(0, dtype=object),
+        })
+    merged = pd.concat(frames, ignore_index=True).astype({"campaign_id": np.int64})
+    merged["date"] = pd.to_datetime(merged["date"]).astype("datetime64[ns]")
+    return merged.drop_duplicates(ignore_index=True)
+
+
+def save_campaign_sends(sends: pd.DataFrame, out_dir: Path = TIMELINE_DIR, suffix: str = "") -> str:
+    """Persist a send table next to the timeline; returns the (unsuffixed) file name."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(out_dir / f"{SENDS_FILE}{suffix}", "wb") as f:
+        np.savez(
+            f,
+            campaign_id=sends["campaign_id"].to_numpy(dtype=np.int64),
+            date=sends["date"].to_numpy(dtype="datetime64[ns]"),
+            channel=sends["channel"].to_numpy(dtype=str),
+        )
+    return SENDS_FILE
+
+
+def load_campaign_sends(in_dir: Path = TIMELINE_DIR) -> Optional[pd.DataFrame]:
+    """Load a send table written by `save_campaign_sends`, or None if there is none."""
+    path = in_dir / SENDS_FILE
+    if not path.exists():
+        return None
+    with np.load(path) as arrays:
+        return pd.DataFrame({
+            "campaign_id": arrays["campaign_id"],
+            "date": arrays["date"],
+            "channel": arrays["channel"].astype(object),
+        })
+
+
+def save_timeline_index(timeline: CustomerTimeline, out_dir: Path = TIMELINE_DIR, suffix: str = "") -> List[str]:
+    """
+    Persist a timeline as one .npy file per array plus a small JSON header,
+    so it can be memory-mapped by `load_timeline_index`.
+
+    Args:
+        timeline: timeline to write.
+        out_dir: target directory.
+        suffix: appended to every file name, to stage files that are moved
+            into place later (see etl.watch).
+    Returns:
+        The (unsuffixed) file names written, ending with 'meta.json'; replace
+        them in this order so readers never see a header without its arrays.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    names = []
+    for name in ("offsets",) + _EVENT_ARRAYS:
+        with open(out_dir / f"{name}.npy{suffix}", "wb") as f:
+            np.save(f, np.asarray(getattr(timeline, name)))
+        names.append(f"{name}.npy")
+    meta = {"channels": timeline.channels, "events": len(timeline), "customers": len(timeline.offsets) - 1}
+    with open(out_dir / f"meta.json{suffix}", "w") as f:
+        json.dump(meta, f)
+    names.append("meta.json")
+    logger.info(f"Saved customer timeline to {out_dir} ({len(timeline):,} events)")
+    return names
+
+
+def load_timeline_index(
+    in_dir: Path = TIMELINE_DIR,
+    mmap: bool = True,
+    retries: int = LOAD_RETRIES,
+) -> Optional[CustomerTimeline]:
+    """
+    Load a timeline written by `save_timeline_index`.
+
+    The watch mode replaces the files one by one, header last; a load that
+    lands in between sees arrays that disagree with the header and retries.
+
+    Args:
+        in_dir: directory holding the timeline files.
+        mmap: memory-map the arrays instead of reading them into RAM.
+        retries: attempts left when the files are mid-replacement.
+    Returns:
+        CustomerTimeline, or None if no timeline has been written yet.
+    Raises:
+        RuntimeError: if the files stay inconsistent.
+    """
+    if not (in_dir / "meta.json").exists():
+        logger.warning(f"No customer timeline found in {in_dir}")
+        return None
+    mode = "r" if mmap else None
+    with open(in_dir / "meta.json") as f:
+        meta = json.load(f)
+    arrays = {
+        name: np.load(in_dir / f"{name}.npy", mmap_mode=mode)
+        for name in ("offsets",) + _EVENT_ARRAYS
+    }
+    consistent = all(len(arrays[name]) == meta.get("events", len(arrays["customer_id"])) for name in _EVENT_ARRAYS)
+    consistent &= len(arrays["offsets"]) - 1 == meta.get("customers", len(arrays["offsets"]) - 1)
+    consistent &= len(arrays["offsets"]) > 0 and int(arrays["offsets"][-1]) == len(arrays["customer_id"])
+    if not consistent:
+        if retries <= 0:
+            raise RuntimeError(f"Customer timeline in {in_dir} is inconsistent; rebuild it with the ETL")
+        time.sleep(LOAD_RETRY_SECONDS)
+        return load_timeline_index(in_dir, mmap, retries - 1)
+    return CustomerTimeline(channels=meta["channels"], **arrays)
@@ -5,6 +5,8 @@ import pandas as pd
 import logging
 from typing import Dict
 
+from etl.ids import encode_ids
+
 # set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -56,6 +58,7 @@ def transform_dataset(name: str, df: pd.DataFrame) -> pd.DataFrame:
     logger.info(f"--- Transforming {name} (shape={df.shape}) ---")
     df = parse_dates(df)
     df = cast_numerics(df)
+    df = encode_ids(df)
     # any dataset-specific logic can go here:
     # e.g. rename columns, drop duplicates, fill NAs
     if name.startswith("email_campaigns"):
@@ -0,0 +1,333 @@
+# etl/watch.py
+
+import io
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from etl.aggregates import build_aggregates, merge_aggregates, read_aggregate, write_aggregate
+from etl.ids import decode_ids
+from etl.ingest import RAW_DATA_DIR, dataset_name, detect_compression, list_raw_files, load_all_data, load_csv
+from etl.load import CLEANED_DATA_DIR
+from etl.sketches import (
+    build_all_digests, build_all_sketches, load_digests, load_sketches,
+    merge_sketches, merge_tdigest_sets, save_digests, save_sketches,
+)
+from etl.timeline import (
+    TOUCH_DATASETS, build_timeline_index, campaign_sends, extend_timeline_index, load_campaign_sends,
+    load_timeline_index, save_campaign_sends, save_timeline_index,
+)
+from etl.transform import transform_all, transform_dataset
+
+# configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "_watch_state.json"
+PENDING_SUFFIX = ".pending"
+SKETCH_SUBDIR = "sketches"
+TIMELINE_SUBDIR = "timeline"
+DEFAULT_INTERVAL = 5.0
+
+
+def _empty_state() -> dict:
+    return {"batch": 0, "files": {}, "cleaned_sizes": {}, "pending": None}
+
+
+def load_state(clean_dir: Path) -> Optional[dict]:
+    """Read the watcher's bookkeeping, or None if the watcher never ran here."""
+    path = clean_dir / STATE_FILE
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def save_state(state: dict, clean_dir: Path) -> None:
+    """Atomically replace the watcher's bookkeeping; this is the commit point of a batch."""
+    _write_atomic(clean_dir / STATE_FILE, json.dumps(state, indent=1).encode())
+
+
+def _read_new_rows(path: Path, seen: Optional[dict]) -> Tuple[Optional[pd.DataFrame], Optional[dict]]:
+    """
+    Read the rows of a raw file that have not been consumed yet.
+
+    Plain CSVs are tailed from the byte offset of the last complete line
+    consumed, so a line that is still being written is left for the next
+    poll. Compressed files cannot be tailed and are consumed once, whole.
+
+    Returns:
+        (new rows or None, updated file bookkeeping or None if unchanged)
+    """
+    stat = path.stat()
+    if detect_compression(path):
+        if seen is not None:
+            if seen["size"] != stat.st_size:
+                logger.warning(f"Ignoring change to already-consumed compressed file {path.name}")
+            return None, None
+        return load_csv(path), {"offset": stat.st_size, "size": stat.st_size, "header": None}
+
+    offset = seen["offset"] if seen else 0
+    if stat.st_size < offset:
+        logger.warning(f"{path.name} shrank below its consumed offset; re-bootstrap to pick up rewrites")
+        return None, None
+    if stat.st_size == offset:
+        return None, None
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        chunk = f.read(stat.st_size - offset)
+    if seen is None:
+        header, newline, chunk = chunk.partition(b"\n")
+        if not newline:  # header line not complete yet
+            return None, None
+        header += b"\n"
+        consumed = len(header)
+    else:
+        header = seen["header"].encode()
+        consumed = 0
+    complete = chunk.rfind(b"\n") + 1
+    chunk = chunk[:complete]
+    info = {"offset": offset + consumed + complete, "size": stat.st_size, "header": header.decode()}
+    if not chunk:
+        return None, info
+    return pd.read_csv(io.BytesIO(header + chunk)), info
+
+
+def collect_deltas(raw_dir: Path, state: dict) -> Tuple[Dict[str, pd.DataFrame], Dict[str, dict]]:
+    """
+    Gather unconsumed raw rows per dataset without writing anything.
+
+    Returns:
+        (dataset -> transformed new rows, file name -> updated bookkeeping)
+    """
+    raw_parts: Dict[str, List[pd.DataFrame]] = {}
+    file_updates: Dict[str, dict] = {}
+    for path in list_raw_files(raw_dir):
+        rows, info = _read_new_rows(path, state["files"].get(path.name))
+        if info is not None:
+            file_updates[path.name] = info
+        if rows is not None and not rows.empty:
+            raw_parts.setdefault(dataset_name(path), []).append(rows)
+
+    deltas = {
+        name: transform_dataset(name, pd.concat(parts, ignore_index=True))
+        for name, parts in raw_parts.items()
+    }
+    return deltas, file_updates
+
+
+def _apply_pending(state: dict, clean_dir: Path) -> None:
+    """
+    Apply a committed batch's staged outputs. Idempotent: appends first
+    truncate the cleaned file back to its pre-batch size, and staged
+    timeline files, aggregates and sketches are moved into place (in
+    staging order) only if still present. Staged appends are deleted only
+    after the cleared state is saved.
+    """
+    pending = state["pending"]
+    for name, base_size in pending["appends"].items():
+        target = clean_dir / f"{name}.csv"
+        staged = clean_dir / f"{name}.csv{PENDING_SUFFIX}"
+        with open(target, "ab") as f:
+            f.truncate(base_size)
+        with open(target, "ab") as f:
+            f.write(staged.read_bytes())
+            f.flush()
+            os.fsync(f.fileno())
+        state["cleaned_sizes"][name] = target.stat().st_size
+    for rel_path in pending["replaces"]:
+        staged = clean_dir / f"{rel_path}{PENDING_SUFFIX}"
+        if staged.exists():
+            os.replace(staged, clean_dir / rel_path)
+    # the batch is done once the cleared state is saved; only then may the
+    # staged appends go, or a crash in between would leave nothing to re-apply
+    state["pending"] = None
+    save_state(state, clean_dir)
+    for name in pending["appends"]:
+        (clean_dir / f"{name}.csv{PENDING_SUFFIX}").unlink(missing_ok=True)
+
+
+def _outputs_match_state(state: dict, clean_dir: Path) -> bool:
+    """False if a cleaned dataset was rewritten behind the watcher's back (e.g. by a full ETL run)."""
+    for name, size in state["cleaned_sizes"].items():
+        path = clean_dir / f"{name}.csv"
+        if not path.exists() or path.stat().st_size != size:
+            return False
+    return True
+
+
+def _discard_stale_staging(clean_dir: Path) -> None:
+    for staged in clean_dir.rglob(f"*{PENDING_SUFFIX}"):
+        staged.unlink()
+
+
+def _stage_timeline(deltas: Dict[str, pd.DataFrame], state: dict, clean_dir: Path) -> List[str]:
+    """
+    Stage the customer timeline extended by a batch, so readers only ever
+    memory-map it, together with the campaign send table that new
+    transactions are matched against. The first batch builds both from the
+    (complete) deltas; a later batch finding either missing (e.g. state from
+    an older watcher) rebuilds it once from the cleaned datasets plus the
+    deltas.
+
+    Returns:
+        Relative paths of the staged files, timeline header last.
+    """
+    timeline_dir = clean_dir / TIMELINE_SUBDIR
+    current = load_timeline_index(timeline_dir) if state["batch"] > 0 else None
+    sends = load_campaign_sends(timeline_dir) if current is not None else None
+    if current is None or sends is None:
+        data = dict(deltas)
+        if state["batch"] > 0:
+            cleaned = transform_all(load_all_data(clean_dir))
+            data = {
+                name: pd.concat([df for df in (cleaned.get(name), deltas.get(name)) if df is not None],
+                                ignore_index=True)
+                for name in set(cleaned) | set(deltas)
+            }
+        if "website_visits" not in data and "customer_transactions" not in data:
+            return []
+        timeline = build_timeline_index(data)
+        sends = campaign_sends(data)
+    else:
+        timeline = extend_timeline_index(current, deltas, sends)
+        # the send table only changes with new ad rows
+        sends = campaign_sends(deltas, sends) if any(name in deltas for name in TOUCH_DATASETS) else None
+    names = [save_campaign_sends(sends, timeline_dir, suffix=PENDING_SUFFIX)] if sends is not None else []
+    names += save_timeline_index(timeline, timeline_dir, suffix=PENDING_SUFFIX)
+    return [f"{TIMELINE_SUBDIR}/{name}" for name in names]
+
+
+def run_batch(raw_dir: Path = RAW_DATA_DIR, clean_dir: Path = CLEANED_DATA_DIR) -> int:
+    """
+    Consume new raw rows once, appending them to the cleaned datasets and
+    folding them into the customer timeline, the aggregate tables and the
+    distinct-count sketches.
+
+    Every batch is staged to '.pending' files, committed by atomically
+    rewriting the state file, then applied. A crash before the commit leaves
+    the outputs untouched and the rows unconsumed; a crash after it is
+    finished by the next call. Each raw row is therefore applied exactly once.
+
+    On the very first run (no state file) every raw row is new, so the
+    cleaned datasets, timeline, aggregates and sketches are rebuilt from
+    scratch.
+
+    Returns:
+        Number of new rows applied.
+    """
+    clean_dir.mkdir(parents=True, exist_ok=True)
+    state = load_state(clean_dir)
+    if state is None:
+        state = _empty_state()
+    elif state["pending"]:
+        logger.info(f"Finishing interrupted batch {state['batch']}")
+        _apply_pending(state, clean_dir)
+    if not _outputs_match_state(state, clean_dir):
+        logger.warning("Cleaned outputs changed outside the watcher; rebuilding them from raw data")
+        state = _empty_state()
+    _discard_stale_staging(clean_dir)
+
+    deltas, file_updates = collect_deltas(raw_dir, state)
+    if not deltas:
+        if file_updates:  # e.g. header-only new files
+            state["files"].update(file_updates)
+            save_state(state, clean_dir)
+        return 0
+
+    appends: Dict[str, int] = {}
+    for name, rows in deltas.items():
+        base_size = state["cleaned_sizes"].get(name, 0)
+        first_write = base_size == 0
+        rows = decode_ids(rows)
+        if not first_write:  # keep the existing file's column order
+            rows = rows[pd.read_csv(clean_dir / f"{name}.csv", nrows=0).columns]
+        staged = rows.to_csv(index=False, header=first_write)
+        (clean_dir / f"{name}.csv{PENDING_SUFFIX}").write_text(staged)
+        appends[name] = base_size
+
+    replaces: List[str] = _stage_timeline(deltas, state, clean_dir)
+    for name, delta in build_aggregates(deltas).items():
+        current = read_aggregate(name, clean_dir) if state["batch"] > 0 else None
+        write_aggregate(merge_aggregates(current, delta), clean_dir / f"{name}.csv{PENDING_SUFFIX}")
+        replaces.append(f"{name}.csv")
+    for name, delta in build_all_sketches(deltas).items():
+        rel_path = f"{SKETCH_SUBDIR}/{name}.npz"
+        current = load_sketches(clean_dir / rel_path) if state["batch"] > 0 else None
+        save_sketches(merge_sketches(current, delta), clean_dir / f"{rel_path}{PENDING_SUFFIX}")
+        replaces.append(rel_path)
+    for name, delta in build_all_digests(deltas).items():
+        rel_path = f"{SKETCH_SUBDIR}/{name}.npz"
+        current = load_digests(clean_dir / rel_path) if state["batch"] > 0 else None
+        save_digests(merge_tdigest_sets(current, delta), clean_dir / f"{rel_path}{PENDING_SUFFIX}")
+        replaces.append(rel_path)
+
+    state["batch"] += 1
+    state["files"].update(file_updates)
+    state["pending"] = {"appends": appends, "replaces": replaces}
+    save_state(state, clean_dir)  # commit point
+    _apply_pending(state, clean_dir)
+
+    n_rows = sum(len(rows) for rows in deltas.values())
+    logger.info(
+        f"Batch {state['batch']}: applied {n_rows:,} new rows "
+        f"({', '.join(f'{k}={len(v):,}' for k, v in deltas.items())})"
+    )
+    return n_rows
+
+
+def watch(
+    raw_dir: Path = RAW_DATA_DIR,
+    clean_dir: Path = CLEANED_DATA_DIR,
+    interval: float = DEFAULT_INTERVAL,
+    max_batches: Optional[int] = None,
+) -> None:
+    """
+    Poll `raw_dir` every `interval` seconds and apply new rows with
+    `run_batch` until interrupted (or after `max_batches` polls).
+    """
+    logger.info(f"Watching {raw_dir} every {interval:g}s -> {clean_dir}")
+    polls = 0
+    while max_batches is None or polls < max_batches:
+        started = time.monotonic()
+        try:
+            run_batch(raw_dir, clean_dir)
+        except Exception as e:  # keep watching; the batch was not committed
+            logger.exception(f"Batch failed, will retry: {e}")
+        polls += 1
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incrementally apply new raw rows to the cleaned outputs.")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between polls")
+    parser.add_argument("--once", action="store_true", help="apply one batch and exit")
+    args = parser.parse_args()
+
+    if args.once:
+        run_batch()
+    else:
+        try:
+            watch(interval=args.interval)
+        except KeyboardInterrupt:
+            logger.info("Watcher stopped.")
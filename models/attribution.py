@@ -1,6 +1,12 @@
 # models/attribution.py
 
+import numpy as np
 import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+from typing import List, Tuple
+
+from etl.timeline import EVENT_TRANSACTION
 
 def linear_attribution(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -19,3 +25,160 @@ def time_decay_attribution(df: pd.DataFrame, decay_rate: float = 0.5) -> pd.Data
     df = df.copy()
     df['attributed_revenue'] = df['purchase_amount'] * decay_rate
     return df
+
+# Markov chain special states
+MARKOV_START, MARKOV_CONVERSION, MARKOV_NULL = "(start)", "(conversion)", "(null)"
+
+def journey_transitions(
+    timeline,
+    campaign_level: bool = False,
+    start=None,
+    end=None,
+) -> Tuple[sparse.csr_matrix, List[str]]:
+    """
+    Count state-to-state transitions over all customer journeys.
+
+    A journey is a customer's run of touches and visits up to and including
+    a transaction (ending in MARKOV_CONVERSION) or, after their last
+    transaction, up to the end of their timeline (ending in MARKOV_NULL).
+    Repeated consecutive states within a journey are collapsed.
+
+    Args:
+        timeline: etl.timeline.CustomerTimeline.
+        campaign_level: use one state per (channel, campaign) for campaign
+            touches instead of one per channel.
+        start, end: optional bounds on the event timestamps considered.
+    Returns:
+        (sparse transition counts, state names); state 0 is MARKOV_START and
+        the last two are MARKOV_CONVERSION and MARKOV_NULL.
+    """
+    customers = np.asarray(timeline.customer_id)
+    timestamps = np.asarray(timeline.timestamp)
+    mask = np.ones(len(customers), dtype=bool)
+    if start is not None:
+        mask &= timestamps >= pd.Timestamp(start).to_datetime64()
+    if end is not None:
+        mask &= timestamps < (pd.Timestamp(end) + pd.Timedelta(days=1)).to_datetime64()
+    customers = customers[mask]
+    is_txn = np.asarray(timeline.kind)[mask] == EVENT_TRANSACTION
+    channel = np.asarray(timeline.channel)[mask].astype(np.int64)
+    campaign = np.asarray(timeline.campaign_id)[mask]
+
+    # state labels of touch/visit events
+    labels = np.array(timeline.channels, dtype=object)[np.maximum(channel, 0)]
+    if campaign_level:
+        labels = np.where(campaign >= 0, labels + ":" + campaign.astype(str), labels)
+    touch_codes, touch_states = pd.factorize(labels[~is_txn], sort=True)
+    n_touch = len(touch_states)
+    conversion, null = n_touch + 1, n_touch + 2
+    codes = np.full(len(customers), conversion, dtype=np.int64)
+    codes[~is_txn] = touch_codes + 1
+
+    # journey key: transactions close the journey they belong to
+    new_customer = np.r_[True, customers[1:] != customers[:-1]]
+    closed_before = np.cumsum(is_txn) - is_txn
+    customer_first = np.maximum.accumulate(np.where(new_customer, np.arange(len(customers)), 0))
+    journey = closed_before - closed_before[customer_first]
+    new_journey = new_customer | np.r_[False, journey[1:] != journey[:-1]]
+
+    # collapse repeats, then add the trailing null of unconverted journeys
+    keep = new_journey | np.r_[True, codes[1:] != codes[:-1]] | is_txn
+    codes, new_journey = codes[keep], new_journey[keep]
+    last_of_journey = np.r_[new_journey[1:], True]
+    unconverted = last_of_journey & (codes != conversion)
+    insert_at = np.flatnonzero(unconverted) + 1
+    codes = np.insert(codes, insert_at, null)
+    new_journey = np.insert(new_journey, insert_at, False)
+
+    sources = np.where(new_journey, 0, np.r_[0, codes[:-1]])
+    counts = sparse.coo_matrix(
+        (np.ones(len(codes)), (sources, codes)), shape=(n_touch + 3, n_touch + 3)
+    ).tocsr()
+    states = [MARKOV_START] + [str(s) for s in touch_states] + [MARKOV_CONVERSION, MARKOV_NULL]
+    return counts, states
+
+def removal_effects(counts: sparse.spmatrix) -> np.ndarray:
+    """
+    Conversion probability lost when each transient state is removed.
+
+    The chain's transient states are 0 (start) .. n-3; the last two states
+    are conversion and null. Removing state k sends every transition into k
+    to null. The baseline and all removals are absorbed in one sparse solve
+    of a block-diagonal system, block k being (I - Q_k) x_k = r_k with Q_k
+    and r_k the transient transitions and conversion column with k removed.
+
+    Returns:
+        Array of removal effects for states 1..n-3 (the start state has none).
+    """
+    counts = sparse.csr_matrix(counts, dtype=float)
+    n_transient = counts.shape[0] - 2
+    row_totals = np.asarray(counts.sum(axis=1)).ravel()
+    probs = sparse.diags(1.0 / np.where(row_totals > 0, row_totals, 1.0)) @ counts
+    q = probs[:n_transient, :n_transient].tocoo()
+    r = probs[:n_transient, n_transient].toarray().ravel()
+
+    # block 0 is the baseline, block k removes state k
+    n_blocks = n_transient
+    block = np.repeat(np.arange(n_blocks), q.nnz)
+    rows, cols, vals = np.tile(q.row, n_blocks), np.tile(q.col, n_blocks), np.tile(q.data, n_blocks)
+    keep = (block == 0) | ((rows != block) & (cols != block))
+    offset = block[keep] * n_transient
+    size = n_blocks * n_transient
+    system = sparse.identity(size, format="csr") - sparse.csr_matrix(
+        (vals[keep], (rows[keep] + offset, cols[keep] + offset)), shape=(size, size)
+    )
+    rhs = np.tile(r, n_blocks)
+    removed = np.arange(1, n_blocks) * n_transient + np.arange(1, n_blocks)
+    rhs[removed] = 0.0
+
+    # a symmetric-pattern ordering keeps the LU fill-in within each block low
+    absorbed = spsolve(system.tocsc(), rhs, permc_spec="MMD_AT_PLUS_A")
+    start_probs = absorbed[::n_transient]
+    baseline = start_probs[0]
+    if baseline <= 0:
+        return np.zeros(n_blocks - 1)
+    return 1.0 - start_probs[1:] / baseline
+
+def markov_attribution(
+    timeline,
+    campaign_level: bool = False,
+    start=None,
+    end=None,
+) -> pd.DataFrame:
+    """
+    Data-driven (Markov chain removal effect) attribution of conversions
+    and revenue to the channels, sources and optionally campaigns seen in
+    customer journeys.
+
+    Args:
+        timeline: etl.timeline.CustomerTimeline.
+        campaign_level: one state per (channel, campaign) for campaign touches.
+        start, end: optional bounds on the event timestamps considered.
+    Returns:
+        DataFrame with columns ['state', 'channel', 'removal_effect', 'share',
+        'attributed_conversions', 'attributed_revenue'], one row per state;
+        shares sum to 1 and attributed revenue sums to total revenue.
+    """
+    counts, states = journey_transitions(timeline, campaign_level, start, end)
+    effects = np.clip(removal_effects(counts), 0.0, None)
+    total_effect = effects.sum()
+    share = effects / total_effect if total_effect > 0 else np.zeros_like(effects)
+
+    timestamps = np.asarray(timeline.timestamp)
+    is_txn = np.asarray(timeline.kind) == EVENT_TRANSACTION
+    if start is not None:
+        is_txn &= timestamps >= pd.Timestamp(start).to_datetime64()
+    if end is not None:
+        is_txn &= timestamps < (pd.Timestamp(end) + pd.Timedelta(days=1)).to_datetime64()
+    conversions = int(is_txn.sum())
+    revenue = float(np.asarray(timeline.amount)[is_txn].sum())
+
+    touch_states = states[1:-2]
+    return pd.DataFrame({
+        "state": touch_states,
+        "channel": [s.split(":", 1)[0] for s in touch_states],
+        "removal_effect": effects,
+        "share": share,
+        "attributed_conversions": share * conversions,
+        "attributed_revenue": share * revenue,
+    })
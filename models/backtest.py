@@ -0,0 +1,215 @@
+# models/backtest.py
+
+import itertools
+import logging
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from models.roi_forecast import forecast_roi
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+METRICS = ("mape", "smape", "mae")
+RESULT_COLUMNS = ["series", "config_id", "config", "cutoff", *METRICS, "error"]
+
+# Prepared series shared with pool workers once, via the pool initializer
+_SERIES: Dict[str, pd.Series] = {}
+
+
+def config_grid(
+    trends: Sequence[Optional[str]] = (None, "add"),
+    seasonals: Sequence[Optional[str]] = (None, "add"),
+    seasonal_periods: Sequence[int] = (7,),
+) -> List[dict]:
+    """
+    All distinct `forecast_roi` keyword combinations of the given settings.
+    Non-seasonal configurations are not repeated per seasonal period.
+    """
+    configs = []
+    for trend, seasonal in itertools.product(trends, seasonals):
+        periods = seasonal_periods if seasonal else (None,)
+        for sp in periods:
+            configs.append({"trend": trend, "seasonal": seasonal, "seasonal_periods": sp})
+    return configs
+
+
+def config_label(config: dict) -> str:
+    """Short readable name of a configuration, e.g. 'trend=add seasonal=add/7'."""
+    seasonal = config.get("seasonal")
+    if seasonal:
+        seasonal = f"{seasonal}/{config.get('seasonal_periods')}"
+    return f"trend={config.get('trend')} seasonal={seasonal}"
+
+
+def rolling_origin_cutoffs(n_obs: int, horizon: int, n_cutoffs: int, min_train: int) -> List[int]:
+    """
+    Training-window lengths for rolling-origin evaluation: the last cutoff
+    leaves exactly `horizon` observations to forecast, earlier cutoffs step
+    back by `horizon`, and no window is shorter than `min_train`.
+    """
+    last = n_obs - horizon
+    cutoffs = [last - i * horizon for i in range(n_cutoffs)]
+    return sorted(c for c in cutoffs if c >= min_train)
+
+
+def forecast_errors(actual: np.ndarray, predicted: np.ndarray) -> Dict[str, float]:
+    """
+    MAPE (over non-zero actuals), sMAPE and MAE of one forecast window.
+    """
+    actual = np.asarray(actual, dtype=float)
+    predicted = np.asarray(predicted, dtype=float)
+    abs_err = np.abs(predicted - actual)
+    nonzero = actual != 0
+    denom = np.abs(actual) + np.abs(predicted)
+    return {
+        "mape": float(np.mean(abs_err[nonzero] / np.abs(actual[nonzero]))) if nonzero.any() else np.nan,
+        "smape": float(np.mean(np.divide(2 * abs_err, denom, out=np.zeros_like(denom), where=denom > 0))),
+        "mae": float(np.mean(abs_err)),
+    }
+
+
+def _init_worker(series: Dict[str, pd.Series]) -> None:
+    """Pool worker initializer; only ever runs in a worker process."""
+    global _SERIES
+    _SERIES = series
+    # one log line per fit would drown the pool's progress output
+    logging.getLogger("models.roi_forecast").setLevel(logging.WARNING)
+
+
+@contextmanager
+def _in_process(series: Dict[str, pd.Series]) -> Iterator[None]:
+    """
+    In-process counterpart of `_init_worker`: installs the series and quiets
+    the per-fit log lines, restoring the caller's state on exit.
+    """
+    global _SERIES
+    forecast_logger = logging.getLogger("models.roi_forecast")
+    previous_series, previous_level = _SERIES, forecast_logger.level
+    _SERIES = series
+    forecast_logger.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        _SERIES = previous_series
+        forecast_logger.setLevel(previous_level)
+
+
+def _evaluate(task: Tuple[str, int, dict, List[int], int]) -> List[dict]:
+    """Fit one configuration on one series at every cutoff."""
+    name, config_id, config, cutoffs, horizon = task
+    ts = _SERIES[name]
+    rows = []
+    for cutoff in cutoffs:
+        row = {"series": name, "config_id": config_id, "config": config_label(config), "cutoff": ts.index[cutoff - 1]}
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                forecast = forecast_roi(ts.iloc[:cutoff], periods=horizon, **config)
+            row.update(forecast_errors(ts.iloc[cutoff:cutoff + horizon].to_numpy(), forecast.to_numpy()))
+            row["error"] = None
+        except Exception as e:  # a config that cannot fit a window scores NaN, not a crash
+            row.update({m: np.nan for m in METRICS})
+            row["error"] = str(e)
+        rows.append(row)
+    return rows
+
+
+def run_backtest(
+    series: Dict[str, pd.Series],
+    configs: Optional[List[dict]] = None,
+    horizon: int = 14,
+    n_cutoffs: int = 4,
+    min_train: int = 28,
+    max_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Rolling-origin evaluation of every configuration on every series.
+
+    Each (series, configuration) pair is one task covering all of its
+    cutoffs; tasks run on a process pool whose workers receive the prepared
+    series once at start-up, so only small task tuples cross processes.
+
+    Args:
+        series: name -> prepared time series (e.g. from `prepare_time_series`).
+        configs: `forecast_roi` keyword dicts; defaults to `config_grid()`.
+        horizon: forecast length per cutoff.
+        n_cutoffs: number of rolling origins per series.
+        min_train: shortest training window allowed.
+        max_workers: pool size; 1 runs in-process.
+    Returns:
+        DataFrame with RESULT_COLUMNS and one row per (series, config,
+        cutoff); empty if every series is too short.
+    """
+    configs = configs if configs is not None else config_grid()
+    tasks = []
+    for name, ts in series.items():
+        cutoffs = rolling_origin_cutoffs(len(ts), horizon, n_cutoffs, min_train)
+        if not cutoffs:
+            logger.warning(f"Series '{name}' too short to backtest ({len(ts)} obs)")
+            continue
+        tasks.extend((name, i, config, cutoffs, horizon) for i, config in enumerate(configs))
+
+    max_workers = max_workers or os.cpu_count() or 1
+    logger.info(f"Backtesting {len(tasks)} series/config pairs on {max_workers} worker(s)")
+    if not tasks:
+        chunks = []
+    elif max_workers == 1:
+        with _in_process(series):
+            chunks = [_evaluate(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(series,)) as pool:
+            chunks = list(pool.map(_evaluate, tasks, chunksize=max(1, len(tasks) // (4 * max_workers))))
+
+    results = pd.DataFrame([row for chunk in chunks for row in chunk], columns=RESULT_COLUMNS)
+    logger.info(f"Backtest complete: {len(results)} fits")
+    return results
+
+
+def summarize_backtest(results: pd.DataFrame) -> pd.DataFrame:
+    """Mean error metrics and failed-fit count per (series, config)."""
+    return (
+        results.groupby(["series", "config_id", "config"])
+        .agg(
+            mape=("mape", "mean"),
+            smape=("smape", "mean"),
+            mae=("mae", "mean"),
+            failed_fits=("error", lambda e: int(e.notna().sum())),
+        )
+        .reset_index()
+    )
+
+
+def select_best_configs(summary: pd.DataFrame, configs: List[dict], metric: str = "smape") -> pd.DataFrame:
+    """
+    Pick the configuration with the lowest mean `metric` per series.
+
+    Returns:
+        DataFrame indexed by series with the winning config label, its
+        metrics and the `forecast_roi` keyword arguments under 'params'.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'; expected one of {METRICS}")
+    scored = summary[summary["failed_fits"] == 0].dropna(subset=[metric])
+    best = scored.loc[scored.groupby("series")[metric].idxmin()].set_index("series")
+    best["params"] = [configs[i] for i in best["config_id"]]
+    return best
+
+
+if __name__ == "__main__":
+    from models.roi_forecast import prepare_time_series
+
+    txn = pd.read_csv("data/cleaned/customer_transactions.csv", parse_dates=["purchase_date"])
+    campaign_series: Dict[str, pd.Series] = {
+        f"campaign_{cid}": prepare_time_series(group, date_col="purchase_date", value_col="amount")
+        for cid, group in txn.groupby("campaign_id")
+    }
+    grid = config_grid()
+    summary = summarize_backtest(run_backtest(campaign_series, grid))
+    print(select_best_configs(summary, grid)[["config", "mape", "smape", "mae"]].to_string())
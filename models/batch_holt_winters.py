@@ -0,0 +1,365 @@
+# models/batch_holt_winters.py
+
+import logging
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+GRID_SIZE = 343          # initial candidates per series, spread over the free smoothing parameters
+REFINE_ROUNDS = 16       # pattern-search rounds after the initial grid
+REFINE_STARTS = 3        # best grid points refined per series
+MAX_BATCH_ELEMENTS = 8_000_000  # stored one-step errors per recursion chunk
+
+
+@dataclass
+class BatchHoltWintersResult:
+    """
+    Fitted additive Holt-Winters models of many series.
+
+    Smoothing parameters follow statsmodels' ExponentialSmoothing
+    conventions (smoothing_trend <= smoothing_level, smoothing_seasonal
+    <= 1 - smoothing_level), so they are directly comparable.
+    """
+    alpha: np.ndarray           # (S,) smoothing_level
+    beta: np.ndarray            # (S,) smoothing_trend (0 without trend)
+    gamma: np.ndarray           # (S,) smoothing_seasonal (0 without seasonality)
+    initial_state: np.ndarray   # (S, k) [level, trend?, seasonal_0..m-1]
+    sse: np.ndarray             # (S,) in-sample sum of squared one-step errors
+    level: np.ndarray           # (S,) final level
+    trend: np.ndarray           # (S,) final trend
+    season: np.ndarray          # (S, m) final seasonal ring, indexed by time % m
+    n_obs: int
+    seasonal_periods: int
+
+    def forecast(self, periods: int) -> np.ndarray:
+        """Forecasts of every series, shape (S, periods)."""
+        h = np.arange(1, periods + 1)
+        values = self.level[:, None] + h[None, :] * self.trend[:, None]
+        if self.seasonal_periods:
+            values = values + self.season[:, (self.n_obs + h - 1) % self.seasonal_periods]
+        return values
+
+
+def _state_size(has_trend: bool, m: int) -> int:
+    return 1 + int(has_trend) + m
+
+
+def _one_step_errors(n_obs: int, y, level, trend, season, alpha, beta, gamma) -> np.ndarray:
+    """
+    Run additive Holt-Winters recursions for many runs at once, in the
+    error-correction form
+
+        e_t = y_t - (l + b + s_{t-m})
+        l  <- l + b + alpha e_t
+        b  <- b + alpha beta e_t
+        s_t = s_{t-m} + gamma e_t
+
+    The states are updated in place and end as the final states.
+
+    Args:
+        n_obs: number of time steps.
+        y: (T, ...) observations broadcastable to the state shape, or None
+            for all-zero observations.
+        level, trend: state arrays of any shape (trend None without trend).
+        season: (m, ...) seasonal ring indexed by time % m, or None.
+        alpha, beta, gamma: smoothing parameters broadcastable to the states.
+    Returns:
+        (T, ...) one-step errors.
+    """
+    errors = np.empty((n_obs,) + level.shape)
+    level_gain = alpha
+    trend_gain = alpha * beta
+    for t in range(n_obs):
+        err = errors[t]
+        np.negative(level, out=err)
+        if trend is not None:
+            err -= trend
+            level += trend
+        if season is not None:
+            err -= season[t % len(season)]
+        if y is not None:
+            err += y[t]
+        level += level_gain * err
+        if trend is not None:
+            trend += trend_gain * err
+        if season is not None:
+            season[t % len(season)] += gamma * err
+    return errors
+
+
+def _unit_state_errors(n_obs: int, alpha, beta, gamma, has_trend: bool, m: int) -> np.ndarray:
+    """
+    Errors of runs started from each unit initial state with y = 0, i.e.
+    how each initial state propagates into the one-step errors.
+
+    Returns:
+        (T, k, P) errors for P candidate parameters.
+    """
+    k = _state_size(has_trend, m)
+    n_cand = len(alpha)
+    level = np.zeros((k, n_cand))
+    level[0] = 1.0
+    trend = None
+    if has_trend:
+        trend = np.zeros((k, n_cand))
+        trend[1] = 1.0
+    season = None
+    if m:
+        season = np.zeros((m, k, n_cand))
+        season[np.arange(m), np.arange(k - m, k)] = 1.0
+    return _one_step_errors(n_obs, None, level, trend, season, alpha, beta, gamma)
+
+
+def _zero_state_errors(y: np.ndarray, shape, alpha, beta, gamma, has_trend: bool, m: int) -> np.ndarray:
+    """Errors of runs over y started from an all-zero state, with states of the given shape."""
+    trend = np.zeros(shape) if has_trend else None
+    season = np.zeros((m,) + tuple(shape)) if m else None
+    return _one_step_errors(len(y), y, np.zeros(shape), trend, season, alpha, beta, gamma)
+
+
+def _concentrated_sse(basis: np.ndarray, data: np.ndarray):
+    """
+    Best initial states and SSE of every (series, candidate) pair.
+
+    The one-step errors are affine in the initial state x0: e = a + B x0,
+    with a the errors from a zero initial state and B the unit-state
+    errors, which depend on the smoothing parameters only. x0 =
+    -pinv(B'B) B'a minimizes the SSE exactly, which is what statsmodels'
+    'estimated' initialization searches for numerically.
+
+    Args:
+        basis: (T, k, P) unit-state errors of P candidates.
+        data: (T, S, P) zero-state errors of S series under each candidate.
+    Returns:
+        (x0 of shape (S, P, k), sse of shape (S, P))
+    """
+    b = basis.transpose(2, 1, 0)                      # (P, k, T)
+    gram = b @ b.transpose(0, 2, 1)                   # (P, k, k)
+    cross = b @ data.transpose(2, 0, 1)               # (P, k, S)
+    x0 = -(np.linalg.pinv(gram, rcond=1e-10, hermitian=True) @ cross)
+    sse = np.einsum("tsp,tsp->sp", data, data) + np.einsum("pks,pks->sp", cross, x0)
+    return x0.transpose(2, 0, 1), np.maximum(sse, 0.0)
+
+
+def _to_params(u: np.ndarray, has_trend: bool, m: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Map unit-cube points to (alpha, beta, gamma) under statsmodels'
+    constraints. The level coordinate is squared so the search resolves the
+    small smoothing levels typical of noisy daily series.
+    """
+    alpha = u[..., 0] ** 2
+    beta = u[..., 1] * alpha if has_trend else np.zeros_like(alpha)
+    gamma = u[..., -1] * (1 - alpha) if m else np.zeros_like(alpha)
+    return alpha, beta, gamma
+
+
+def _grid(n_dims: int, values: np.ndarray) -> np.ndarray:
+    axes = np.meshgrid(*[values] * n_dims, indexing="ij")
+    return np.stack([a.ravel() for a in axes], axis=-1)
+
+
+def _evaluate_grid(y: np.ndarray, grid: np.ndarray, has_trend: bool, m: int):
+    """
+    Score candidates shared by all series: the unit-state runs are
+    computed once per candidate, only the data runs once per series.
+
+    Args:
+        y: (S, T) series.
+        grid: (P, d) unit-cube candidates.
+    Returns:
+        (sse of shape (S, P), x0 of shape (S, P, k))
+    """
+    n_series, n_obs = y.shape
+    params = _to_params(grid, has_trend, m)
+    basis = _unit_state_errors(n_obs, *params, has_trend, m)
+    chunk = max(1, MAX_BATCH_ELEMENTS // (len(grid) * n_obs))
+    results = []
+    for lo in range(0, n_series, chunk):
+        block = y[lo:lo + chunk].T[:, :, None]
+        data = _zero_state_errors(block, (block.shape[1], len(grid)), *params, has_trend, m)
+        results.append(_concentrated_sse(basis, data))
+    return np.concatenate([r[1] for r in results]), np.concatenate([r[0] for r in results])
+
+
+def _evaluate_rows(y: np.ndarray, u: np.ndarray, has_trend: bool, m: int):
+    """
+    Score candidates specific to each series.
+
+    Args:
+        y: (S, T) series.
+        u: (S, P, d) unit-cube candidates per series.
+    Returns:
+        (sse of shape (S, P), x0 of shape (S, P, k))
+    """
+    n_series, n_cand, n_dims = u.shape
+    n_obs = y.shape[1]
+    k = _state_size(has_trend, m)
+    flat_u = u.reshape(-1, n_dims)
+    flat_y = np.repeat(y, n_cand, axis=0)
+    chunk = max(1, MAX_BATCH_ELEMENTS // (n_obs * (k + 1)))
+    sse = np.empty(len(flat_u))
+    x0 = np.empty((len(flat_u), k))
+    for lo in range(0, len(flat_u), chunk):
+        hi = min(lo + chunk, len(flat_u))
+        params = _to_params(flat_u[lo:hi], has_trend, m)
+        basis = _unit_state_errors(n_obs, *params, has_trend, m)
+        data = _zero_state_errors(flat_y[lo:hi].T[:, None, :], (1, hi - lo), *params, has_trend, m)
+        x0_chunk, sse_chunk = _concentrated_sse(basis, data)
+        sse[lo:hi], x0[lo:hi] = sse_chunk[0], x0_chunk[0]
+    return sse.reshape(n_series, n_cand), x0.reshape(n_series, n_cand, k)
+
+
+def fit_many(
+    y: np.ndarray,
+    trend: Optional[str] = "add",
+    seasonal: Optional[str] = None,
+    seasonal_periods: Optional[int] = None,
+    grid_size: int = GRID_SIZE,
+    rounds: int = REFINE_ROUNDS,
+    starts: int = REFINE_STARTS,
+) -> BatchHoltWintersResult:
+    """
+    Fit additive Holt-Winters models to every row of `y` at once.
+
+    Smoothing parameters are optimized in batch: every series first scores
+    a shared grid over the feasible region, then a compass search refines
+    each of its best `starts` grid points, halving a point's step whenever
+    none of its 2d neighbours improves, and the lowest SSE wins. For each candidate the
+    initial states are solved exactly by least squares (see
+    `_concentrated_sse`).
+
+    Args:
+        y: (S, T) array, one series per row, no missing values.
+        trend: 'add' or None.
+        seasonal: 'add' or None.
+        seasonal_periods: season length when `seasonal` is set.
+        grid_size: initial grid candidates per series.
+        rounds: pattern-search rounds.
+        starts: grid points refined per series.
+    Returns:
+        BatchHoltWintersResult
+    """
+    if trend not in (None, "add") or seasonal not in (None, "add"):
+        raise ValueError("Only additive (or no) trend and seasonality are supported")
+    y = np.asarray(y, dtype=float)
+    if y.ndim != 2 or np.isnan(y).any():
+        raise ValueError("y must be a 2-D array of series without missing values")
+    has_trend = trend == "add"
+    m = int(seasonal_periods or 0) if seasonal == "add" else 0
+    if seasonal == "add" and m < 2:
+        raise ValueError("seasonal_periods must be >= 2 for a seasonal model")
+    n_series, n_obs = y.shape
+    k = _state_size(has_trend, m)
+    if n_obs <= k:
+        raise ValueError(f"Need more than {k} observations to fit this model, got {n_obs}")
+
+    n_dims = 1 + int(has_trend) + int(bool(m))
+    grid_points = max(3, int(round(grid_size ** (1.0 / n_dims))))
+    grid = _grid(n_dims, np.linspace(0.0, 1.0, grid_points))
+    sse, x0 = _evaluate_grid(y, grid, has_trend, m)
+    # refine the best few grid points of every series side by side, as one batch of S * starts rows
+    n_starts = min(starts, len(grid))
+    top = np.argsort(sse, axis=1)[:, :n_starts].reshape(-1)
+    origin = np.repeat(np.arange(n_series), n_starts)
+    best_u, best_sse, best_x0 = grid[top], sse[origin, top], x0[origin, top]
+    rows = np.arange(len(origin))
+
+    stencil = np.concatenate([np.eye(n_dims), -np.eye(n_dims)])
+    step = np.full(len(rows), 1.0 / (grid_points - 1))
+    for _ in range(rounds):
+        u = np.clip(best_u[:, None, :] + step[:, None, None] * stencil[None, :, :], 0.0, 1.0)
+        sse, x0 = _evaluate_rows(y[origin], u, has_trend, m)
+        pick = sse.argmin(axis=1)
+        better = sse[rows, pick] < best_sse
+        best_u = np.where(better[:, None], u[rows, pick], best_u)
+        best_sse = np.where(better, sse[rows, pick], best_sse)
+        best_x0 = np.where(better[:, None], x0[rows, pick], best_x0)
+        # compass search: keep the step while a point improves, halve it once it does not
+        step = np.where(better, step, step / 2)
+
+    winner = best_sse.reshape(n_series, n_starts).argmin(axis=1) + np.arange(n_series) * n_starts
+    best_u, best_sse, best_x0 = best_u[winner], best_sse[winner], best_x0[winner]
+
+    alpha, beta, gamma = _to_params(best_u, has_trend, m)
+    level = best_x0[:, 0].copy()
+    trend_state = best_x0[:, 1].copy() if has_trend else None
+    season = best_x0[:, k - m:].T.copy() if m else None
+    _one_step_errors(n_obs, y.T, level, trend_state, season, alpha, beta, gamma)
+    return BatchHoltWintersResult(
+        alpha=alpha, beta=beta, gamma=gamma, initial_state=best_x0, sse=best_sse,
+        level=level,
+        trend=trend_state if has_trend else np.zeros(n_series),
+        season=season.T if m else np.zeros((n_series, 0)),
+        n_obs=n_obs, seasonal_periods=m,
+    )
+
+
+def forecast_many(
+    series: pd.DataFrame,
+    periods: int = 30,
+    trend: Optional[str] = "add",
+    seasonal: Optional[str] = None,
+    seasonal_periods: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Forecast every column of a (date x series) frame with its own
+    Holt-Winters model, all fitted together by `fit_many`.
+
+    The batched counterpart of `models.roi_forecast.forecast_roi`: same
+    model options, one column per series instead of one call per series.
+    Missing values are treated as zero, as in `prepare_time_series`.
+
+    Returns:
+        DataFrame of forecasts indexed by the next `periods` dates.
+    """
+    values = series.fillna(0).to_numpy(dtype=float).T
+    result = fit_many(values, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods)
+    freq = series.index.freq or pd.infer_freq(series.index)
+    index = pd.date_range(series.index[-1], periods=periods + 1, freq=freq)[1:]
+    logger.info(f"Forecasted {values.shape[0]:,} series for {periods} periods using batched Holt-Winters")
+    return pd.DataFrame(result.forecast(periods).T, index=index, columns=series.columns)
+
+
+def campaign_channel_series(data: dict, value_col: str = "cost") -> pd.DataFrame:
+    """Daily `value_col` of every (campaign, channel) pair as a (date x series) frame."""
+    frames = [data[name] for name in ("facebook_ads", "google_ads", "email_campaigns") if name in data]
+    rows = pd.concat(frames, ignore_index=True)
+    table = rows.pivot_table(
+        index="date", columns=["campaign_id", "channel"], values=value_col, aggfunc="sum", fill_value=0.0)
+    return table.asfreq("D", fill_value=0.0)
+
+
+if __name__ == "__main__":
+    import time
+    import warnings
+
+    from etl.ingest import load_all_data
+    from etl.transform import transform_all
+    from models.roi_forecast import forecast_roi
+
+    portfolio = campaign_channel_series(transform_all(load_all_data()))
+    options = {"trend": "add", "seasonal": "add", "seasonal_periods": 7}
+
+    started = time.perf_counter()
+    batched = forecast_many(portfolio, periods=30, **options)
+    batch_seconds = time.perf_counter() - started
+
+    sample = portfolio.columns[:20]
+    logging.getLogger("models.roi_forecast").setLevel(logging.WARNING)
+    started = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        serial = pd.DataFrame({col: forecast_roi(portfolio[col], periods=30, **options).to_numpy() for col in sample})
+    serial_seconds = (time.perf_counter() - started) / len(sample) * portfolio.shape[1]
+
+    gap = batched[sample].to_numpy() - serial.to_numpy()
+    scale = portfolio[sample].abs().mean().to_numpy()
+    logger.info(
+        f"{portfolio.shape[1]:,} series: batched {batch_seconds:.1f}s vs ~{serial_seconds:.1f}s one statsmodels "
+        f"fit at a time; median forecast gap {np.median(np.abs(gap) / scale):.2%} of series mean"
+    )
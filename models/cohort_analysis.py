@@ -0,0 +1,265 @@
+# models/cohort_analysis.py
+
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from etl.timeline import EVENT_TRANSACTION
+
+COHORT_FREQS = ("M", "W")
+NO_CHANNEL = "(none)"
+ALL_CHANNELS = "all"
+
+# 1970-01-01 was a Thursday; weeks start on Monday 1970-01-05
+_EPOCH_WEEK_SHIFT = 4
+
+# (customer, period) pairs are packed as customer << 32 | (period + 2**31)
+_PERIOD_BIAS = 1 << 31
+
+
+def period_index(dates, freq: str = "M") -> np.ndarray:
+    """Integer period number of each date: months or Monday-based weeks since 1970."""
+    days = pd.to_datetime(np.asarray(dates)).to_numpy().astype("datetime64[D]")
+    if freq == "M":
+        return days.astype("datetime64[M]").astype(np.int64)
+    if freq == "W":
+        return (days.astype(np.int64) - _EPOCH_WEEK_SHIFT) // 7
+    raise ValueError(f"Unknown cohort frequency {freq!r}; expected one of {COHORT_FREQS}")
+
+
+def period_start(periods, freq: str = "M") -> pd.DatetimeIndex:
+    """First day of each integer period (inverse of `period_index`)."""
+    periods = np.asarray(periods, dtype=np.int64)
+    if freq == "M":
+        return pd.DatetimeIndex(periods.astype("datetime64[M]").astype("datetime64[ns]"))
+    if freq == "W":
+        return pd.DatetimeIndex((periods * 7 + _EPOCH_WEEK_SHIFT).astype("datetime64[D]").astype("datetime64[ns]"))
+    raise ValueError(f"Unknown cohort frequency {freq!r}; expected one of {COHORT_FREQS}")
+
+
+def first_touch_channels(timeline) -> pd.Series:
+    """
+    Channel or traffic source of each customer's first touch or visit.
+
+    Args:
+        timeline: etl.timeline.CustomerTimeline.
+    Returns:
+        Series of channel names indexed by customer_id (customers with no
+        touch or visit are absent).
+    """
+    is_touch = (np.asarray(timeline.kind) != EVENT_TRANSACTION) & (np.asarray(timeline.channel) >= 0)
+    customers = np.asarray(timeline.customer_id)[is_touch]
+    channels = np.asarray(timeline.channel)[is_touch]
+    # events are sorted by (customer, timestamp), so the first row per customer is the first touch
+    first_customers, first_rows = np.unique(customers, return_index=True)
+    names = np.array(timeline.channels, dtype=object)[channels[first_rows]]
+    return pd.Series(names, index=pd.Index(first_customers, name="customer_id"), name="first_touch")
+
+
+@dataclass
+class CohortState:
+    """
+    Running cohort matrices, updated in place by `update_cohorts`.
+
+    Cohorts are keyed by (first purchase period, first-touch channel); the
+    matrices are (cohort period, channel, period offset) arrays, so each
+    batch is accumulated with one bincount over flat cell indexes. Per
+    customer, the first purchase period and cohort channel are kept in
+    arrays indexed by customer_id; the (customer, period) pairs already
+    counted as active are kept as a sorted array of packed keys.
+    """
+    freq: str = "M"
+    by_channel: bool = False
+    base_period: int = 0                  # cohort period of matrix row 0
+    last_period: int = -1                 # latest period seen in any batch
+    channels: List[str] = field(default_factory=list)
+    active: np.ndarray = field(default_factory=lambda: np.zeros((0, 0, 0), dtype=np.int64))
+    revenue: np.ndarray = field(default_factory=lambda: np.zeros((0, 0, 0)))
+    first_period: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    cohort_channel: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int16))
+    active_pairs: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+
+    @property
+    def n_customers(self) -> int:
+        return int(np.count_nonzero(self.first_period >= 0))
+
+    def _grow_customers(self, size: int) -> None:
+        extra = size - len(self.first_period)
+        if extra > 0:
+            self.first_period = np.r_[self.first_period, np.full(extra, -1, dtype=np.int64)]
+            self.cohort_channel = np.r_[self.cohort_channel, np.zeros(extra, dtype=np.int16)]
+
+    def _grow_matrices(self, min_period: int, max_period: int) -> None:
+        """Pad the matrices to cover cohorts min..max_period, all channels and offsets."""
+        if self.active.shape[0] == 0:
+            self.base_period = min_period
+        n_rows, _, n_offsets = self.active.shape
+        before = max(0, self.base_period - min_period)
+        after = max(0, max_period - (self.base_period + n_rows - 1))
+        pad = (
+            (before, after),
+            (0, len(self.channels) - self.active.shape[1]),
+            (0, max(0, self.last_period - min(min_period, self.base_period) + 1 - n_offsets)),
+        )
+        self.active = np.pad(self.active, pad)
+        self.revenue = np.pad(self.revenue, pad)
+        self.base_period -= before
+
+
+def _pair_keys(customers: np.ndarray, periods: np.ndarray) -> np.ndarray:
+    return (customers.astype(np.int64) << 32) + (periods + _PERIOD_BIAS)
+
+
+def update_cohorts(
+    state: CohortState,
+    transactions: pd.DataFrame,
+    first_touch: Optional[pd.Series] = None,
+    customer_col: str = "customer_id",
+    date_col: str = "purchase_date",
+    amount_col: str = "amount",
+) -> CohortState:
+    """
+    Fold a batch of new transactions into the cohort matrices.
+
+    Rows may arrive in any order, within and across batches, as long as no
+    row predates its customer's cohort period: a customer-period is counted
+    as active once, however many batches it appears in. A back-dated row
+    would move a customer to an earlier cohort, which cannot be applied
+    incrementally; it raises before the state is touched, so the caller can
+    rebuild with `build_cohorts` instead.
+
+    Args:
+        state: running CohortState (modified in place).
+        transactions: new rows with customer id, purchase date and amount.
+        first_touch: customer_id -> first-touch channel (see
+            `first_touch_channels`); used for new customers when
+            `state.by_channel` is set.
+    Returns:
+        The updated state.
+    Raises:
+        ValueError: for negative customer ids or rows dated before their
+            customer's cohort period; the state is left unchanged.
+    """
+    if transactions.empty:
+        return state
+    customers = transactions[customer_col].to_numpy(dtype=np.int64)
+    periods = period_index(transactions[date_col], state.freq)
+    amounts = transactions[amount_col].to_numpy(dtype=float)
+    if customers.min() < 0:
+        raise ValueError("Cohort analysis requires non-negative integer customer ids")
+    known = customers < len(state.first_period)
+    existing = np.full(len(customers), -1, dtype=np.int64)
+    existing[known] = state.first_period[customers[known]]
+    if ((existing >= 0) & (periods < existing)).any():
+        raise ValueError("Transactions dated before a customer's cohort period; rebuild the cohorts")
+
+    # assign new customers to cohorts
+    state._grow_customers(int(customers.max()) + 1)
+    batch_first = np.full(len(state.first_period), np.iinfo(np.int64).max)
+    np.minimum.at(batch_first, customers, periods)
+    new_customers = np.flatnonzero((batch_first < np.iinfo(np.int64).max) & (state.first_period < 0))
+    state.first_period[new_customers] = batch_first[new_customers]
+    if state.by_channel:
+        names = (
+            first_touch.reindex(new_customers).fillna(NO_CHANNEL).to_numpy(dtype=object)
+            if first_touch is not None else np.full(len(new_customers), NO_CHANNEL, dtype=object)
+        )
+        state.channels.extend(str(name) for name in pd.unique(names) if name not in state.channels)
+        state.cohort_channel[new_customers] = pd.Index(state.channels).get_indexer(names)
+    elif not state.channels:
+        state.channels.append(ALL_CHANNELS)
+
+    cohort_period = state.first_period[customers]
+    offsets = periods - cohort_period
+    state.last_period = max(state.last_period, int(periods.max()))
+    state._grow_matrices(int(cohort_period.min()), int(cohort_period.max()))
+
+    n_rows, n_channels, n_offsets = state.active.shape
+    cells = ((cohort_period - state.base_period) * n_channels + state.cohort_channel[customers]) * n_offsets + offsets
+    state.revenue += np.bincount(cells, weights=amounts, minlength=state.revenue.size).reshape(state.revenue.shape)
+
+    # distinct customer-periods not counted in an earlier batch
+    pairs = np.sort(pd.unique(_pair_keys(customers, periods)))
+    found = np.searchsorted(state.active_pairs, pairs)
+    seen = found < len(state.active_pairs)
+    seen[seen] = state.active_pairs[found[seen]] == pairs[seen]
+    fresh = pairs[~seen]
+    pair_customers, pair_periods = fresh >> 32, (fresh & 0xFFFFFFFF) - _PERIOD_BIAS
+    pair_cells = (
+        (state.first_period[pair_customers] - state.base_period) * n_channels
+        + state.cohort_channel[pair_customers]
+    ) * n_offsets + (pair_periods - state.first_period[pair_customers])
+    state.active += np.bincount(pair_cells, minlength=state.active.size).reshape(state.active.shape)
+    state.active_pairs = np.insert(state.active_pairs, found[~seen], fresh)
+    return state
+
+
+def build_cohorts(
+    transactions: pd.DataFrame,
+    freq: str = "M",
+    first_touch: Optional[pd.Series] = None,
+    customer_col: str = "customer_id",
+    date_col: str = "purchase_date",
+    amount_col: str = "amount",
+) -> CohortState:
+    """
+    Cohort matrices of a full transaction history.
+
+    Args:
+        transactions: rows with customer id, purchase date and amount.
+        freq: 'M' (monthly) or 'W' (weekly, Monday-based) periods.
+        first_touch: customer_id -> first-touch channel; when given, cohorts
+            are split by it.
+    Returns:
+        CohortState; pass it to `update_cohorts` as new transactions arrive.
+    """
+    if freq not in COHORT_FREQS:
+        raise ValueError(f"Unknown cohort frequency {freq!r}; expected one of {COHORT_FREQS}")
+    state = CohortState(freq=freq, by_channel=first_touch is not None)
+    return update_cohorts(state, transactions, first_touch, customer_col, date_col, amount_col)
+
+
+def _triangle(state: CohortState, values: np.ndarray) -> pd.DataFrame:
+    """Label a (cohort period, channel, offset) array, hiding unobserved cells."""
+    n_rows, n_channels, n_offsets = values.shape
+    cohort_periods = state.base_period + np.arange(n_rows)
+    observed = cohort_periods[:, None] + np.arange(n_offsets)[None, :] <= state.last_period
+    values = np.where(observed[:, None, :], values, np.nan).reshape(n_rows * n_channels, n_offsets)
+
+    sizes = state.active[:, :, 0].reshape(-1) if n_offsets else np.zeros(0)
+    starts = period_start(np.repeat(cohort_periods, n_channels), state.freq)
+    if state.by_channel:
+        index = pd.MultiIndex.from_arrays(
+            [starts, np.tile(np.array(state.channels, dtype=object), n_rows)],
+            names=["cohort", "first_touch"],
+        )
+    else:
+        index = pd.Index(starts, name="cohort")
+    frame = pd.DataFrame(values, index=index, columns=pd.RangeIndex(n_offsets, name="period"))
+    return frame[sizes > 0]
+
+
+def cohort_sizes(state: CohortState) -> pd.Series:
+    """Number of customers acquired in each cohort."""
+    sizes = _triangle(state, state.active.astype(float))[0] if state.active.size else pd.Series(dtype=float)
+    return sizes.astype(np.int64).rename("customers")
+
+
+def retention_triangle(state: CohortState) -> pd.DataFrame:
+    """Share of each cohort purchasing in each period after acquisition."""
+    sizes = np.maximum(state.active[:, :, :1], 1)
+    return _triangle(state, state.active / sizes)
+
+
+def revenue_triangle(state: CohortState, cumulative: bool = True) -> pd.DataFrame:
+    """Revenue of each cohort per period after acquisition (cumulative by default)."""
+    revenue = np.cumsum(state.revenue, axis=2) if cumulative else state.revenue
+    return _triangle(state, revenue)
+
+
+def ltv_triangle(state: CohortState) -> pd.DataFrame:
+    """Cumulative revenue per acquired customer, by cohort and period after acquisition."""
+    sizes = np.maximum(state.active[:, :, :1], 1)
+    return _triangle(state, np.cumsum(state.revenue, axis=2) / sizes)
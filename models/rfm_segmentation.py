@@ -1,15 +1,71 @@
 # models/rfm_segmentation.py
 
+import numpy as np
 import pandas as pd
 from datetime import datetime
-from typing import Optional, Union
+from typing import Dict, Optional, Union
+
+from etl.sketches import TDigest, build_tdigest, merge_tdigests
+from etl.timeline import EVENT_TRANSACTION
+
+RFM_METRICS = ("Recency", "Frequency", "Monetary")
+RFM_SCORE_LEVELS = 5
+RFM_PARTITION_SIZE = 50_000  # customers per quantile-sketch partition
+
+# Segment by (Recency score, Frequency score), both 1..5 with 5 best
+RFM_SEGMENTS = np.array([
+    # F=1            F=2                   F=3                   F=4                F=5
+    ["Hibernating",   "Hibernating",        "At Risk",            "At Risk",         "Can't Lose Them"],  # R=1
+    ["Hibernating",   "Hibernating",        "At Risk",            "At Risk",         "Can't Lose Them"],  # R=2
+    ["About to Sleep", "About to Sleep",    "Need Attention",     "Loyal Customers", "Loyal Customers"],  # R=3
+    ["Promising",     "Potential Loyalists", "Potential Loyalists", "Loyal Customers", "Loyal Customers"],  # R=4
+    ["New Customers", "Potential Loyalists", "Potential Loyalists", "Champions",      "Champions"],        # R=5
+])
+
+def rfm_from_timeline(
+    timeline,
+    snapshot_date: Optional[Union[str, datetime]] = None,
+) -> pd.DataFrame:
+    """
+    Compute RFM metrics from a CSR customer timeline (see etl.timeline).
+
+    Events are already sorted by (customer_id, timestamp), so each
+    customer's transactions form one contiguous run and the metrics are
+    segment reductions over those runs instead of a groupby.
+
+    Returns:
+        DataFrame with columns ['customer_id', 'Recency', 'Frequency', 'Monetary']
+    """
+    is_txn = np.asarray(timeline.kind) == EVENT_TRANSACTION
+    customers = np.asarray(timeline.customer_id)[is_txn]
+    timestamps = np.asarray(timeline.timestamp)[is_txn]
+    amounts = np.asarray(timeline.amount)[is_txn]
+    if len(customers) == 0:
+        return pd.DataFrame(columns=["customer_id", "Recency", "Frequency", "Monetary"])
+
+    starts = np.flatnonzero(np.r_[True, customers[1:] != customers[:-1]])
+    ends = np.r_[starts[1:], len(customers)]
+    last_purchase = timestamps[ends - 1]
+
+    if snapshot_date is None:
+        snapshot = timestamps.max() + np.timedelta64(1, "D")
+    else:
+        snapshot = pd.to_datetime(snapshot_date).to_datetime64()
+
+    return pd.DataFrame({
+        "customer_id": customers[starts],
+        "Recency": (snapshot - last_purchase) // np.timedelta64(1, "D"),
+        "Frequency": ends - starts,
+        "Monetary": np.add.reduceat(amounts, starts),
+    })
 
 def calculate_rfm(
-    df: pd.DataFrame,
+    df: Optional[pd.DataFrame] = None,
     snapshot_date: Optional[Union[str, datetime]] = None,
     customer_id_col='customer_id',
     date_col='purchase_date',
-    monetary_col='purchase_amount'
+    monetary_col='purchase_amount',
+    timeline=None
 ) -> pd.DataFrame:
     """
     Compute basic RFM metrics:
@@ -24,10 +80,15 @@ def calculate_rfm(
             - 'purchase_amount'
         snapshot_date: Optional date to calculate recency against.
                        If None, uses max(date_col) + 1 day.
+        timeline: Optional etl.timeline.CustomerTimeline; when given, RFM is
+                  read from it via rfm_from_timeline and df is ignored.
 
     Returns:
         DataFrame with columns ['customer_id', 'Recency', 'Frequency', 'Monetary']
     """
+    if timeline is not None:
+        return rfm_from_timeline(timeline, snapshot_date)
+
     data = df.copy()
 
     # pick date column
@@ -59,3 +120,61 @@ def calculate_rfm(
         .reset_index()
     )
     return rfm
+
+def rfm_digests(rfm: pd.DataFrame, partition_size: int = RFM_PARTITION_SIZE) -> Dict[str, TDigest]:
+    """
+    Quantile sketches of Recency, Frequency and Monetary over the customer base.
+
+    Each block of `partition_size` customers is sketched on its own and the
+    block digests are merged, so no metric is ever sorted as a whole.
+
+    Returns:
+        dict of metric name -> etl.sketches.TDigest
+    """
+    starts = range(0, max(len(rfm), 1), partition_size)
+    return {
+        metric: merge_tdigests(
+            build_tdigest(rfm[metric].to_numpy()[start:start + partition_size]) for start in starts
+        )
+        for metric in RFM_METRICS
+    }
+
+def rfm_cutpoints(digests: Dict[str, TDigest], levels: int = RFM_SCORE_LEVELS) -> Dict[str, np.ndarray]:
+    """Score boundaries of each metric: its 1/levels, ..., (levels-1)/levels quantiles."""
+    q = np.arange(1, levels) / levels
+    return {metric: np.atleast_1d(digests[metric].quantile(q)) for metric in RFM_METRICS}
+
+def assign_rfm_scores(
+    rfm: pd.DataFrame,
+    digests: Optional[Dict[str, TDigest]] = None,
+) -> pd.DataFrame:
+    """
+    Add quintile scores and segment labels to RFM metrics.
+
+    A customer's score on a metric is one plus the number of quintile
+    cutpoints strictly below their value (reversed for Recency, where fewer
+    days is better), found by binary search against the four cutpoints.
+
+    Args:
+        rfm: output of calculate_rfm.
+        digests: quantile sketches of the metrics (see rfm_digests); pass
+                 digests merged from elsewhere to score against a wider base.
+                 Built from `rfm` when omitted.
+
+    Returns:
+        Copy of `rfm` with 'R_Score', 'F_Score', 'M_Score' (1-5, 5 best),
+        'RFM_Score' (e.g. '545') and 'Segment' columns.
+    """
+    if digests is None:
+        digests = rfm_digests(rfm)
+    cutpoints = rfm_cutpoints(digests)
+    scored = rfm.copy()
+    for metric in RFM_METRICS:
+        rank = np.searchsorted(cutpoints[metric], rfm[metric].to_numpy(dtype=float), side="left")
+        score = RFM_SCORE_LEVELS - rank if metric == "Recency" else rank + 1
+        scored[f"{metric[0]}_Score"] = score.astype(np.int8)
+    scored["RFM_Score"] = (
+        scored["R_Score"].astype(str) + scored["F_Score"].astype(str) + scored["M_Score"].astype(str)
+    )
+    scored["Segment"] = RFM_SEGMENTS[scored["R_Score"] - 1, scored["F_Score"] - 1]
+    return scored
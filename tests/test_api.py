@@ -0,0 +1,199 @@
+# tests/test_api.py
+
+import asyncio
+import gzip
+import json
+import shutil
+import time
+
+import pytest
+import pandas as pd
+
+from api.server import ApiStore, handle_request, start_server
+from etl.aggregates import build_aggregates, write_aggregate
+from etl.ingest import load_all_data
+from etl.transform import transform_all
+
+
+@pytest.fixture
+def store(tmp_path):
+    """An API store over a copy of the cleaned data plus its aggregate tables."""
+    data_dir = tmp_path / "cleaned"
+    shutil.copytree("data/cleaned", data_dir)
+    for name, table in build_aggregates(transform_all(load_all_data(data_dir))).items():
+        write_aggregate(table, data_dir / f"{name}.csv")
+    return ApiStore(data_dir, version_ttl=0)
+
+
+def get(store, target, **headers):
+    return handle_request("GET", target, {k.replace("_", "-"): v for k, v in headers.items()}, store)
+
+
+def test_health_and_rollup_listing(store):
+    response = get(store, "/health")
+    assert response.status == 200
+    assert json.loads(response.body) == {"status": "ok", "data_version": store.version()}
+    listing = json.loads(get(store, "/rollups").body)
+    assert listing["rollups"] == ["daily_channel_spend", "daily_revenue"]
+
+
+def test_rollup_pagination_and_columns(store):
+    body = json.loads(get(store, "/rollups/daily_revenue?columns=date,revenue&page=2&page_size=10").body)
+    full = store.rollup("daily_revenue", store.version())
+    assert body["columns"] == ["date", "revenue"]
+    assert body["total_rows"] == len(full)
+    assert body["total_pages"] == -(-len(full) // 10)
+    assert len(body["rows"]) == 10
+    assert body["rows"][0]["revenue"] == pytest.approx(full["revenue"].iloc[10])
+
+    body = json.loads(get(store, "/rollups/daily_channel_spend?start=2024-02-01&end=2024-02-29").body)
+    dates = pd.to_datetime([row["date"] for row in body["rows"]])
+    assert dates.min() >= pd.Timestamp("2024-02-01") and dates.max() <= pd.Timestamp("2024-02-29")
+
+
+def test_etag_revalidation_follows_data_version(store):
+    first = get(store, "/rollups/daily_revenue")
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"' + store.version())
+
+    cached = get(store, "/rollups/daily_revenue", if_none_match=etag)
+    assert cached.status == 304 and cached.body == b""
+    assert get(store, "/rollups/daily_revenue?page_size=5", if_none_match=etag).status == 200
+
+    # new ETL output changes the data version, so the old validator no longer matches
+    time.sleep(0.01)
+    with open(store.data_dir / "daily_revenue.csv", "a") as f:
+        f.write("2024-12-31,1.0,1\n")
+    refreshed = get(store, "/rollups/daily_revenue", if_none_match=etag)
+    assert refreshed.status == 200
+    assert refreshed.headers["ETag"] != etag
+    assert json.loads(refreshed.body)["total_rows"] == json.loads(first.body)["total_rows"] + 1
+
+
+def test_gzip_and_arrow_responses(store):
+    plain = get(store, "/rfm")
+    compressed = get(store, "/rfm", accept_encoding="gzip, deflate")
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.body) == plain.body
+    assert len(compressed.body) < len(plain.body)
+    assert "Content-Encoding" not in get(store, "/health", accept_encoding="gzip").headers  # tiny body
+
+    pa = pytest.importorskip("pyarrow")
+    arrow = get(store, "/rfm?format=arrow&columns=customer_id,Segment&page_size=50")
+    assert arrow.headers["Content-Type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(arrow.body).read_all()
+    assert table.column_names == ["customer_id", "Segment"]
+    assert table.num_rows == 50
+    meta = json.loads(table.schema.metadata[b"mrip"])
+    assert meta["total_rows"] == len(store.rfm(store.version()))
+    negotiated = get(store, "/rfm?page_size=5", accept="application/vnd.apache.arrow.stream")
+    assert negotiated.headers["Content-Type"] == "application/vnd.apache.arrow.stream"
+
+
+def test_rfm_and_forecast_endpoints(store):
+    body = json.loads(get(store, "/rfm?segment=Champions").body)
+    assert body["total_rows"] > 0
+    assert {row["Segment"] for row in body["rows"]} == {"Champions"}
+
+    body = json.loads(get(store, "/forecast?periods=7").body)
+    assert body["columns"] == ["date", "forecast_revenue"]
+    assert len(body["rows"]) == 7
+    assert all(row["forecast_revenue"] >= 0 for row in body["rows"])
+    # one forecast per data version serves every horizon from the result cache
+    misses = store.cache.misses
+    get(store, "/forecast?periods=7")
+    longer = json.loads(get(store, "/forecast?periods=90").body)
+    assert store.cache.misses == misses
+    assert len(longer["rows"]) == 90
+    assert longer["rows"][:7] == body["rows"]
+
+
+def test_etag_and_body_share_one_data_version(store):
+    # the ETL writes new output while the RFM table is being computed
+    build_timeline = store._timeline
+
+    def timeline_during_write():
+        timeline = build_timeline()
+        if not (store.data_dir / "late.csv").exists():
+            time.sleep(0.01)
+            (store.data_dir / "late.csv").write_text("x\n1\n")
+        return timeline
+
+    store._timeline = timeline_during_write
+    old_version = store.version()
+    response = get(store, "/rfm?page_size=1")
+    assert response.status == 200
+    new_version = store.version(refresh=True)
+    assert new_version != old_version
+    assert json.loads(response.body)["data_version"] == new_version
+    assert response.headers["ETag"].startswith('W/"' + new_version)
+    assert (old_version, "rfm") not in store.cache
+
+
+@pytest.mark.parametrize("target, status", [
+    ("/missing", 404),
+    ("/rollups/unknown", 404),
+    ("/rollups/daily_revenue?columns=date,nope", 400),
+    ("/rollups/daily_revenue?page=0", 400),
+    ("/rollups/daily_revenue?page_size=abc", 400),
+    ("/forecast?periods=10000", 400),
+    ("/rfm?format=xml", 400),
+])
+def test_request_errors(store, target, status):
+    response = get(store, target)
+    assert response.status == status
+    assert "error" in json.loads(response.body)
+
+
+def test_read_only(store):
+    response = handle_request("POST", "/rfm", {}, store)
+    assert response.status == 405
+    assert response.headers["Allow"] == "GET, HEAD"
+
+
+def test_server_keeps_connection_alive(store):
+    async def exchange():
+        server = await start_server("127.0.0.1", 0, store)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        statuses = []
+        for target in ("/health", "/rollups/daily_revenue?page_size=2"):
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            await writer.drain()
+            head = (await reader.readuntil(b"\r\n\r\n")).decode()
+            headers = dict(line.split(": ", 1) for line in head.strip().split("\r\n")[1:])
+            body = await reader.readexactly(int(headers["Content-Length"]))
+            statuses.append((head.split(" ")[1], headers["Connection"], json.loads(body)))
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return statuses
+
+    statuses = asyncio.run(exchange())
+    assert [s[:2] for s in statuses] == [("200", "keep-alive"), ("200", "keep-alive")]
+    assert len(statuses[1][2]["rows"]) == 2
+
+
+@pytest.mark.parametrize("content_length", ["abc", "-5", str(1 << 30)])
+def test_server_rejects_bad_content_length(store, content_length):
+    async def exchange():
+        server = await start_server("127.0.0.1", 0, store)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET /health HTTP/1.1\r\nHost: localhost\r\nContent-Length: {content_length}\r\n\r\n".encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 10)  # answered, then closed
+        # a well-formed request still gets through on a new connection
+        reader, writer2 = await asyncio.open_connection("127.0.0.1", port)
+        writer2.write(b"GET /health HTTP/1.1\r\nHost: localhost\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}")
+        await writer2.drain()
+        healthy = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+        writer2.close()
+        server.close()
+        await server.wait_closed()
+        return response.decode(), healthy.decode()
+
+    response, healthy = asyncio.run(exchange())
+    assert response.startswith("HTTP/1.1 400 ")
+    assert healthy.startswith("HTTP/1.1 200 ")
@@ -0,0 +1,49 @@
+# tests/test_dashboard.py
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from dashboard.downsample import lttb_indices, minmax_indices, downsample_frame
+
+
+@pytest.fixture
+def long_series():
+    # hourly noise with a single sharp spike
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2022-01-01", periods=100_000, freq="h")
+    values = rng.normal(100, 5, len(index))
+    values[54_321] = 10_000
+    return pd.Series(values, index=index, name="revenue")
+
+
+def test_lttb_keeps_endpoints_and_peak(long_series):
+    y = long_series.to_numpy()
+    idx = lttb_indices(np.arange(len(y), dtype=float), y, 500)
+    assert len(idx) == 500
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+    assert (np.diff(idx) > 0).all()
+    assert 54_321 in idx
+
+
+def test_minmax_keeps_extremes(long_series):
+    y = long_series.to_numpy()
+    idx = minmax_indices(y, 300)
+    assert len(idx) <= 2 * 300 + 2
+    assert y.argmax() in idx and y.argmin() in idx
+
+
+def test_downsample_frame(long_series):
+    frame = pd.DataFrame({"a": long_series, "b": long_series[::-1].to_numpy()})
+    for method in ("lttb", "minmax"):
+        small = downsample_frame(frame, 1200, method)
+        assert len(small) <= 1200 + 4
+        assert small.index.is_monotonic_increasing
+        assert small["a"].max() == frame["a"].max()
+        assert small["b"].max() == frame["b"].max()
+
+    # short series pass through untouched
+    short = long_series.iloc[:100]
+    assert downsample_frame(short, 1200) is short
+    with pytest.raises(ValueError):
+        downsample_frame(long_series, 1200, method="median")
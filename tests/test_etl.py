@@ -1,11 +1,24 @@
 # tests/test_etl.py
 
 import pytest
+import shutil
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
-from etl.ingest import load_all_data
+from etl.ingest import load_all_data, load_csv, dataset_name, benchmark_readers
 from etl.transform import transform_all
+from etl.ids import parse_uuids, format_uuids, encode_ids, decode_ids
+from etl.timeline import (TOUCH_DATASETS, build_timeline_index, extend_timeline_index,
+                          save_timeline_index, load_timeline_index, campaign_sends,
+                          save_campaign_sends, load_campaign_sends)
+from etl.aggregates import build_aggregates, read_aggregate
+from etl.result_cache import ResultCache, data_version, result_size
+from etl.sketches import (build_hll_sketches, build_all_sketches, merge_sketches,
+                          hll_standard_error, save_sketches, load_sketches,
+                          build_tdigest, merge_tdigests, build_tdigest_set, merge_tdigest_sets,
+                          build_all_digests, save_digests, load_digests)
+import etl.watch as watch_module
 import etl.load as load_module  # to monkeypatch CLEANED_DATA_DIR
 
 
@@ -26,6 +39,48 @@ def test_load_all_data(raw_data):
         assert not df.empty, f"{name} should not be empty"
 
 
+def test_dataset_name():
+    assert dataset_name(Path("facebook_ads.csv")) == "facebook_ads"
+    assert dataset_name(Path("facebook_ads.csv.gz")) == "facebook_ads"
+    assert dataset_name(Path("facebook_ads.csv.zst")) == "facebook_ads"
+    assert dataset_name(Path("facebook_ads__2024-05-01.csv.gz")) == "facebook_ads"
+
+
+@pytest.mark.parametrize("engine", ["pandas", "pyarrow"])
+def test_load_gzip_feed(tmp_path, engine):
+    if engine == "pyarrow":
+        pytest.importorskip("pyarrow")
+    source = Path("data/raw/customer_transactions.csv")
+    expected = pd.read_csv(source)
+    expected.loc[3, "transaction_id"] = np.nan  # written as an empty field
+    expected.to_csv(tmp_path / "customer_transactions.csv.gz", index=False, compression="gzip")
+
+    data = load_all_data(tmp_path, engine=engine)
+    assert set(data) == {"customer_transactions"}
+    assert data["customer_transactions"]["transaction_id"].isna().tolist() == expected["transaction_id"].isna().tolist()
+    cleaned = transform_all(data)["customer_transactions"]
+    pd.testing.assert_frame_equal(
+        decode_ids(cleaned), transform_all({"customer_transactions": expected})["customer_transactions"]
+        .pipe(decode_ids), check_dtype=False,
+    )
+
+
+def test_load_zstd_feed_and_benchmark(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    source = Path("data/raw/website_visits.csv")
+    target = tmp_path / "website_visits.csv.zst"
+    with pa.output_stream(str(target), compression="zstd") as out:
+        out.write(source.read_bytes())
+
+    df = load_csv(target, engine="pyarrow")
+    assert len(df) == len(pd.read_csv(source))
+
+    bench = benchmark_readers(source, repeats=1)
+    assert set(bench["engine"]) == {"pandas", "pyarrow"}
+    assert (bench["rows"] == len(df)).all()
+    assert (bench["mb_per_sec"] > 0).all()
+
+
 def test_transform_all(raw_data):
     cleaned = transform_all(raw_data)
     assert isinstance(cleaned, dict)
@@ -69,3 +124,381 @@ def test_save_all_data(tmp_path, monkeypatch, raw_data):
         assert len(df) == len(cleaned[name]), (
             f"Row count mismatch in {path}: {len(df)} vs {len(cleaned[name])}"
         )
+
+    # Ids are written back in their original string form
+    saved = pd.read_csv(Path(tmp_path) / "website_visits.csv")
+    assert (saved["session_id"] == raw_data["website_visits"]["session_id"]).all()
+
+
+def test_uuid_round_trip(raw_data):
+    ids = raw_data["facebook_ads"]["ad_id"]
+    hi, lo = parse_uuids(ids)
+    assert hi.dtype == "uint64" and lo.dtype == "uint64"
+    assert (format_uuids(hi, lo) == ids.to_numpy().astype(str)).all()
+
+    # upper case input is accepted; malformed input is rejected
+    hi_upper, lo_upper = parse_uuids(ids.str.upper())
+    assert (hi_upper == hi).all() and (lo_upper == lo).all()
+    with pytest.raises(ValueError):
+        parse_uuids(["not-a-uuid"])
+
+
+def test_transform_encodes_ids(raw_data):
+    cleaned = transform_all(raw_data)
+    txn = cleaned["customer_transactions"]
+    assert "transaction_id" not in txn.columns
+    assert txn["transaction_id_hi"].dtype == "uint64"
+    assert txn["transaction_id_lo"].dtype == "uint64"
+    # decoding restores the original column order and values
+    decoded = decode_ids(txn)
+    assert list(decoded.columns) == list(raw_data["customer_transactions"].columns)
+    assert (decoded["transaction_id"] == raw_data["customer_transactions"]["transaction_id"]).all()
+
+
+def test_decode_nullable_ids(raw_data):
+    fb = encode_ids(raw_data["facebook_ads"].head(3), dtype="UInt64")
+    email = encode_ids(raw_data["email_campaigns"].head(2), dtype="UInt64")
+    merged = decode_ids(pd.concat([fb, email], ignore_index=True))
+    assert merged["ad_id"].iloc[:3].tolist() == raw_data["facebook_ads"]["ad_id"].head(3).tolist()
+    assert merged["ad_id"].iloc[3:].isna().all()
+    assert merged["email_id"].iloc[3:].tolist() == raw_data["email_campaigns"]["email_id"].head(2).tolist()
+
+
+def test_missing_ids(raw_data):
+    ads = raw_data["facebook_ads"].head(4).copy()
+    ads.loc[[1, 3], "ad_id"] = np.nan
+    hi, lo = parse_uuids(ads["ad_id"])
+    assert hi[1] == lo[1] == hi[3] == lo[3] == 0
+    assert (format_uuids(hi, lo)[[0, 2]] == ads["ad_id"].iloc[[0, 2]].to_numpy()).all()
+
+    encoded = encode_ids(ads)
+    assert encoded["ad_id_hi"].dtype == "UInt64"
+    assert encoded["ad_id_hi"].isna().tolist() == [False, True, False, True]
+    decoded = decode_ids(encoded)
+    assert decoded["ad_id"].isna().tolist() == [False, True, False, True]
+    assert decoded["ad_id"].iloc[[0, 2]].tolist() == ads["ad_id"].iloc[[0, 2]].tolist()
+
+
+def test_timeline_index(tmp_path, raw_data):
+    cleaned = transform_all(raw_data)
+    timeline = build_timeline_index(cleaned)
+    visits = cleaned["website_visits"]
+    txn = cleaned["customer_transactions"]
+
+    # events are grouped by customer and time-ordered within each customer
+    assert (timeline.customer_id[:-1] <= timeline.customer_id[1:]).all()
+    assert timeline.offsets[-1] == len(timeline)
+
+    customer = int(txn["customer_id"].iloc[0])
+    events = timeline.events(customer)
+    assert events["timestamp"].is_monotonic_increasing
+    assert (events["event"] == "visit").sum() == (visits["customer_id"] == customer).sum()
+    assert (events["event"] == "transaction").sum() == (txn["customer_id"] == customer).sum()
+    assert events.loc[events["event"] == "touch", "channel"].isin(
+        ["Facebook", "Google", "Email"]).all()
+    assert timeline.events(10**9).empty
+
+    save_timeline_index(timeline, tmp_path)
+    loaded = load_timeline_index(tmp_path)
+    assert loaded.channels == timeline.channels
+    pd.testing.assert_frame_equal(loaded.events(customer), events)
+
+    # arrays replaced without their header (an interrupted update) are detected
+    np.save(tmp_path / "amount.npy", timeline.amount[:-1])
+    with pytest.raises(RuntimeError):
+        load_timeline_index(tmp_path, retries=0)
+
+
+def test_hll_sketch_accuracy_and_merge():
+    rng = np.random.default_rng(0)
+    n = 200_000
+    df = pd.DataFrame({
+        "customer_id": rng.integers(0, 100_000, n),
+        "visit_date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 30, n), unit="D"),
+        "source": rng.choice(["Direct", "Referral", "Social"], n),
+    })
+    sketches = build_hll_sketches(df, "visit_date", "source", "customer_id")
+    assert len(sketches) == 90
+    bound = 4 * hll_standard_error()
+
+    exact = df["customer_id"].nunique()
+    assert abs(sketches.estimate() - exact) / exact < bound
+    in_range = df[(df["visit_date"] <= "2024-01-10") & (df["source"] != "Social")]
+    exact = in_range["customer_id"].nunique()
+    estimate = sketches.estimate("2024-01-01", "2024-01-10", ["Direct", "Referral"])
+    assert abs(estimate - exact) / exact < bound
+    assert sketches.estimate("2025-01-01") == 0.0
+
+    # sketches of two halves merge into exactly the sketch of the whole
+    halves = [build_hll_sketches(part, "visit_date", "source", "customer_id")
+              for part in (df.iloc[: n // 2], df.iloc[n // 2:])]
+    merged = merge_sketches(*halves)
+    assert (merged.days == sketches.days).all()
+    assert (merged.registers == sketches.registers).all()
+
+
+def test_hll_sketches_on_cleaned_data(tmp_path, raw_data):
+    clean = transform_all(raw_data)
+    sketches = build_all_sketches(clean)
+    assert set(sketches) == {"visit_customers", "visit_sessions", "purchasing_customers"}
+
+    visits = clean["website_visits"]
+    for source, group in visits.groupby("source"):
+        estimate = sketches["visit_customers"].estimate(groups=[source])
+        assert abs(estimate - group["customer_id"].nunique()) / group["customer_id"].nunique() < 0.05
+    estimate = sketches["visit_sessions"].estimate()
+    assert abs(estimate - len(visits)) / len(visits) < 0.05
+
+    save_sketches(sketches["purchasing_customers"], tmp_path / "p.npz")
+    loaded = load_sketches(tmp_path / "p.npz")
+    assert loaded.estimate() == sketches["purchasing_customers"].estimate()
+    assert load_sketches(tmp_path / "missing.npz") is None
+
+    # visits without a session id are left out of the session count
+    raw_visits = raw_data["website_visits"].copy()
+    raw_visits.loc[raw_visits.index[:10], "session_id"] = np.nan
+    with_missing = build_all_sketches(transform_all({"website_visits": raw_visits}))
+    expected = raw_visits["session_id"].nunique()
+    assert abs(with_missing["visit_sessions"].estimate() - expected) / expected < 0.05
+    assert with_missing["visit_customers"].estimate() == sketches["visit_customers"].estimate()
+
+
+def _rank_error(sorted_values, estimates, q):
+    """How far (in rank) each estimate is from its target quantile."""
+    below = np.searchsorted(sorted_values, estimates, side="left") / len(sorted_values)
+    at_or_below = np.searchsorted(sorted_values, estimates, side="right") / len(sorted_values)
+    return np.maximum(0, np.maximum(below - q, q - at_or_below))
+
+
+def test_tdigest_accuracy_and_merge():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(5, 1, 200_000)
+    q = np.linspace(0.01, 0.99, 99)
+    exact = np.sort(values)
+
+    digest = build_tdigest(values)
+    assert digest.count == len(values)
+    assert len(digest.means) <= digest.compression
+    assert digest.quantile(0) == values.min() and digest.quantile(1) == values.max()
+    assert _rank_error(exact, digest.quantile(q), q).max() < 0.005
+
+    # digests of partitions merge into a digest of the whole
+    merged = merge_tdigests(build_tdigest(part) for part in np.array_split(values, 40))
+    assert merged.count == len(values)
+    assert _rank_error(exact, merged.quantile(q), q).max() < 0.005
+    assert abs(merged.cdf(np.median(values)) - 0.5) < 0.005
+    assert np.isnan(build_tdigest([]).quantile(0.5))
+
+
+def test_daily_tdigests(tmp_path):
+    rng = np.random.default_rng(1)
+    n = 100_000
+    df = pd.DataFrame({
+        "purchase_date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 60, n), unit="D"),
+        "amount": rng.gamma(2.0, 500.0, n),
+    })
+    digests = build_tdigest_set(df, "purchase_date", "amount")
+    assert len(digests) == 60
+
+    q = np.array([0.1, 0.5, 0.9, 0.99])
+    in_range = df[(df["purchase_date"] >= "2024-01-15") & (df["purchase_date"] <= "2024-02-05")]
+    estimates = digests.quantiles(q, "2024-01-15", "2024-02-05")
+    assert digests.digest("2024-01-15", "2024-02-05").count == len(in_range)
+    assert _rank_error(np.sort(in_range["amount"]), estimates, q).max() < 0.01
+
+    halves = merge_tdigest_sets(
+        build_tdigest_set(df.iloc[: n // 2], "purchase_date", "amount"),
+        build_tdigest_set(df.iloc[n // 2:], "purchase_date", "amount"),
+    )
+    assert (halves.days == digests.days).all()
+    assert halves.digest().count == n
+    assert _rank_error(np.sort(df["amount"]), halves.quantiles(q), q).max() < 0.01
+
+    save_digests(halves, tmp_path / "amount.npz")
+    loaded = load_digests(tmp_path / "amount.npz")
+    np.testing.assert_array_equal(loaded.quantiles(q), halves.quantiles(q))
+
+
+def _timeline_frame(timeline):
+    names = np.array(timeline.channels + [None], dtype=object)
+    frame = pd.DataFrame({
+        "customer_id": timeline.customer_id, "timestamp": timeline.timestamp, "kind": timeline.kind,
+        "channel": names[timeline.channel], "campaign_id": timeline.campaign_id, "amount": timeline.amount,
+    })
+    # events with equal (customer, time, kind) may come in either order
+    return frame.sort_values(list(frame.columns), na_position="first").reset_index(drop=True)
+
+
+def _assert_same_events(timeline, expected):
+    assert timeline.channels == expected.channels
+    np.testing.assert_array_equal(timeline.offsets, expected.offsets)
+    pd.testing.assert_frame_equal(_timeline_frame(timeline), _timeline_frame(expected))
+
+
+def test_extend_timeline_matches_rebuild(raw_data):
+    cleaned = transform_all(raw_data)
+    rng = np.random.default_rng(3)
+    old, new = {}, {}
+    for name, df in cleaned.items():
+        keep = rng.random(len(df)) < 0.7
+        old[name], new[name] = df[keep].reset_index(drop=True), df[~keep].reset_index(drop=True)
+    # a traffic source and a customer the timeline has not seen yet
+    new["website_visits"].loc[:2, "source"] = "Affiliate"
+    new["website_visits"].loc[3, "customer_id"] = int(cleaned["website_visits"]["customer_id"].max()) + 10
+
+    ads = pd.concat([old[name] for name in TOUCH_DATASETS], ignore_index=True)
+    extended = extend_timeline_index(build_timeline_index(old), new, ads)
+    combined = {name: pd.concat([old[name], new[name]], ignore_index=True) for name in cleaned}
+    _assert_same_events(extended, build_timeline_index(combined))
+
+    # the compact send table stands in for the ad rows
+    sends = campaign_sends(old)
+    assert len(sends) <= len(ads)
+    _assert_same_events(extend_timeline_index(build_timeline_index(old), new, sends), extended)
+
+
+def _sorted_sends(sends):
+    return sends.sort_values(["campaign_id", "date", "channel"], ignore_index=True)
+
+
+def test_campaign_sends_round_trip(tmp_path, raw_data):
+    cleaned = transform_all(raw_data)
+    half = {name: df.iloc[: len(df) // 2] for name, df in cleaned.items()}
+    rest = {name: df.iloc[len(df) // 2:] for name, df in cleaned.items()}
+    sends = campaign_sends(cleaned)
+    assert not sends.duplicated().any()
+    pd.testing.assert_frame_equal(_sorted_sends(campaign_sends(rest, campaign_sends(half))), _sorted_sends(sends))
+
+    assert load_campaign_sends(tmp_path) is None
+    save_campaign_sends(sends, tmp_path)
+    pd.testing.assert_frame_equal(load_campaign_sends(tmp_path), sends)
+
+
+def _assert_watch_outputs_match_full_run(raw_dir, clean_dir):
+    """Cleaned files, timeline and aggregates equal what a full recompute would give."""
+    full = transform_all(load_all_data(raw_dir))
+    # aggregate tables written next to the cleaned datasets are not datasets
+    assert sorted(load_all_data(clean_dir)) == sorted(full)
+    _assert_same_events(load_timeline_index(clean_dir / "timeline"), build_timeline_index(full))
+    pd.testing.assert_frame_equal(
+        _sorted_sends(load_campaign_sends(clean_dir / "timeline")), _sorted_sends(campaign_sends(full)))
+    for name, df in full.items():
+        saved = pd.read_csv(clean_dir / f"{name}.csv")
+        expected = decode_ids(df)
+        assert len(saved) == len(expected), name
+        assert list(saved.columns) == list(expected.columns)
+    for name, table in build_aggregates(full).items():
+        pd.testing.assert_frame_equal(
+            read_aggregate(name, clean_dir), table, check_dtype=False, check_index_type=False)
+    for name, sketches in build_all_sketches(full).items():
+        saved = load_sketches(clean_dir / "sketches" / f"{name}.npz")
+        assert (saved.registers == sketches.registers).all(), name
+        assert (saved.groups == sketches.groups).all()
+    for name, digests in build_all_digests(full).items():
+        saved = load_digests(clean_dir / "sketches" / f"{name}.npz")
+        assert (saved.days == digests.days).all(), name
+        daily_counts = [saved.day_digest(i).count for i in range(len(saved))]
+        assert daily_counts == [digests.day_digest(i).count for i in range(len(digests))]
+
+
+def test_watch_applies_appended_rows_once(tmp_path, monkeypatch):
+    raw_dir, clean_dir = tmp_path / "raw", tmp_path / "cleaned"
+    shutil.copytree("data/raw", raw_dir)
+
+    # first batch bootstraps every dataset
+    assert watch_module.run_batch(raw_dir, clean_dir) == 5 * 979
+    assert watch_module.run_batch(raw_dir, clean_dir) == 0
+    _assert_watch_outputs_match_full_run(raw_dir, clean_dir)
+
+    # appended purchases are matched against the stored send table, not the ad files
+    def full_read(*args, **kwargs):
+        raise AssertionError("batch re-read the cleaned datasets")
+
+    monkeypatch.setattr(watch_module, "load_all_data", full_read)
+    monkeypatch.setattr(watch_module, "transform_all", full_read)
+
+    # appended rows, with a trailing line still being written
+    lines = Path("data/raw/customer_transactions.csv").read_text().splitlines()
+    with open(raw_dir / "customer_transactions.csv", "a") as f:
+        f.write("\n".join(lines[1:4]) + "\n" + lines[4][:10])
+    assert watch_module.run_batch(raw_dir, clean_dir) == 3
+    with open(raw_dir / "customer_transactions.csv", "a") as f:
+        f.write(lines[4][10:] + "\n")
+    assert watch_module.run_batch(raw_dir, clean_dir) == 1
+
+    # a newly dropped compressed partition of an existing dataset
+    pd.read_csv("data/raw/google_ads.csv").head(5).to_csv(
+        raw_dir / "google_ads__extra.csv.gz", index=False, compression="gzip")
+    assert watch_module.run_batch(raw_dir, clean_dir) == 5
+    _assert_watch_outputs_match_full_run(raw_dir, clean_dir)
+
+    # a crash after the commit point is finished, not repeated, by the next batch
+    with open(raw_dir / "website_visits.csv", "a") as f:
+        f.write(Path("data/raw/website_visits.csv").read_text().splitlines()[1] + "\n")
+    apply_pending = watch_module._apply_pending
+
+    def crash(state, clean_dir):
+        raise RuntimeError("simulated crash")
+
+    monkeypatch.setattr(watch_module, "_apply_pending", crash)
+    with pytest.raises(RuntimeError):
+        watch_module.run_batch(raw_dir, clean_dir)
+    monkeypatch.setattr(watch_module, "_apply_pending", apply_pending)
+    assert watch_module.run_batch(raw_dir, clean_dir) == 0
+    _assert_watch_outputs_match_full_run(raw_dir, clean_dir)
+
+    # a crash while the applied batch is being marked done is finished too
+    with open(raw_dir / "customer_transactions.csv", "a") as f:
+        f.write(lines[5] + "\n")
+    save_state = watch_module.save_state
+
+    def crash_on_clear(state, clean_dir):
+        if state["pending"] is None:
+            raise RuntimeError("simulated crash")
+        save_state(state, clean_dir)
+
+    monkeypatch.setattr(watch_module, "save_state", crash_on_clear)
+    with pytest.raises(RuntimeError):
+        watch_module.run_batch(raw_dir, clean_dir)
+    monkeypatch.setattr(watch_module, "save_state", save_state)
+    assert watch_module.run_batch(raw_dir, clean_dir) == 0
+    assert watch_module.run_batch(raw_dir, clean_dir) == 0
+    _assert_watch_outputs_match_full_run(raw_dir, clean_dir)
+
+
+def test_result_cache_lru_and_counters():
+    frame = pd.DataFrame({"x": np.arange(1000, dtype=float)})
+    size = result_size(frame)
+    cache = ResultCache(max_bytes=int(size * 2.5))
+    calls = []
+
+    def compute(tag):
+        calls.append(tag)
+        return frame.copy()
+
+    cache.get_or_compute(("v1", "a"), lambda: compute("a"))
+    cache.get_or_compute(("v1", "b"), lambda: compute("b"))
+    cache.get_or_compute(("v1", "a"), lambda: compute("a"))  # hit, 'a' becomes most recent
+    cache.get_or_compute(("v1", "c"), lambda: compute("c"))  # evicts least recent 'b'
+    assert calls == ["a", "b", "c"]
+    assert ("v1", "a") in cache and ("v1", "b") not in cache
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 3, 1)
+    assert stats["entries"] == 2
+    assert stats["size_mb"] * 2**20 <= cache.max_bytes
+
+
+def test_result_cache_skips_oversized_results():
+    cache = ResultCache(max_bytes=10)
+    value = cache.get_or_compute("big", lambda: pd.Series(np.zeros(100)))
+    assert len(value) == 100
+    assert "big" not in cache and cache.current_bytes == 0
+
+
+def test_data_version_tracks_file_changes(tmp_path):
+    (tmp_path / "a.csv").write_text("x\n1\n")
+    before = data_version(tmp_path)
+    assert data_version(tmp_path) == before
+    (tmp_path / "a.csv").write_text("x\n1\n2\n")
+    assert data_version(tmp_path) != before
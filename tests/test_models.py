@@ -1,13 +1,30 @@
 # tests/test_models.py
 
+import logging
 import pytest
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
 # match the actual functions in your code
-from models.attribution import linear_attribution, time_decay_attribution
-from models.rfm_segmentation import calculate_rfm
+from models.attribution import (
+    linear_attribution, time_decay_attribution, journey_transitions, removal_effects, markov_attribution
+)
+from models.rfm_segmentation import calculate_rfm, assign_rfm_scores, rfm_digests
 from models.roi_forecast import prepare_time_series, forecast_roi
+from models.budget_simulator import (
+    adstock, saturation, fit_response_curves, simulate_allocations, optimize_budget
+)
+from models.backtest import (
+    config_grid, rolling_origin_cutoffs, forecast_errors, run_backtest,
+    summarize_backtest, select_best_configs
+)
+from models.cohort_analysis import (
+    period_index, period_start, build_cohorts, update_cohorts, cohort_sizes,
+    retention_triangle, revenue_triangle, ltv_triangle
+)
+from models.batch_holt_winters import fit_many, forecast_many
+from etl.timeline import build_timeline_index
 
 
 @pytest.fixture
@@ -56,6 +73,192 @@ def test_compute_rfm(sample_transactions):
         assert col in rfm.columns
 
 
+def test_assign_rfm_scores_matches_exact_quintiles():
+    rng = np.random.default_rng(0)
+    n = 20_000
+    rfm = pd.DataFrame({
+        "customer_id": np.arange(n),
+        "Recency": rng.integers(1, 365, n),
+        "Frequency": rng.poisson(3, n) + 1,
+        "Monetary": rng.lognormal(6, 1, n),
+    })
+    scored = assign_rfm_scores(rfm)
+    for col in ["R_Score", "F_Score", "M_Score"]:
+        assert scored[col].between(1, 5).all()
+
+    # continuous metric: nearly every customer lands in its exact quintile
+    exact = pd.qcut(rfm["Monetary"], 5, labels=False) + 1
+    assert (scored["M_Score"] == exact).mean() > 0.99
+    # recency is reversed: the most recent customers score highest
+    assert scored.loc[rfm["Recency"].idxmin(), "R_Score"] == 5
+    assert scored.loc[rfm["Recency"].idxmax(), "R_Score"] == 1
+
+    # digests built over small partitions give the same cutpoints
+    partitioned = assign_rfm_scores(rfm, digests=rfm_digests(rfm, partition_size=1_000))
+    assert (partitioned["M_Score"] == scored["M_Score"]).mean() > 0.99
+
+    champions = scored[(scored["R_Score"] == 5) & (scored["F_Score"] == 5)]
+    assert (champions["Segment"] == "Champions").all()
+    assert scored["RFM_Score"].str.len().eq(3).all()
+
+
+def test_rfm_from_timeline(sample_transactions):
+    txn = sample_transactions.rename(columns={"purchase_amount": "amount"})
+    txn["purchase_date"] = pd.to_datetime(txn["purchase_date"])
+    txn["campaign_id"] = 1
+    timeline = build_timeline_index({"customer_transactions": txn})
+
+    expected = calculate_rfm(sample_transactions, snapshot_date=datetime(2024, 1, 21))
+    rfm = calculate_rfm(timeline=timeline, snapshot_date=datetime(2024, 1, 21))
+    pd.testing.assert_frame_equal(rfm, expected, check_dtype=False)
+
+
+@pytest.fixture
+def journey_timeline():
+    # customer 1: A -> B -> purchase, customer 2: A -> (no purchase), customer 3: B -> purchase
+    visits = pd.DataFrame({
+        "customer_id": [1, 1, 1, 2, 3],
+        "visit_date": pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-02", "2024-01-03", "2024-01-04"]),
+        "source": ["A", "A", "B", "A", "B"],
+    })
+    txn = pd.DataFrame({
+        "customer_id": [1, 3],
+        "campaign_id": [7, 7],
+        "purchase_date": pd.to_datetime(["2024-01-05", "2024-01-06"]),
+        "amount": [120.0, 180.0],
+    })
+    return build_timeline_index({"website_visits": visits, "customer_transactions": txn})
+
+
+def test_journey_transitions(journey_timeline):
+    counts, states = journey_transitions(journey_timeline)
+    assert states == ["(start)", "A", "B", "(conversion)", "(null)"]
+    expected = np.zeros((5, 5))
+    expected[0, 1], expected[0, 2] = 2, 1  # start -> A, start -> B
+    expected[1, 2], expected[1, 4] = 1, 1  # A -> B (repeat A collapsed), A -> null
+    expected[2, 3] = 2                     # B -> conversion
+    np.testing.assert_array_equal(counts.toarray(), expected)
+
+
+def test_markov_attribution(journey_timeline):
+    # P(conversion) = 2/3; without A it is 1/3, without B it is 0
+    result = markov_attribution(journey_timeline).set_index("state")
+    np.testing.assert_allclose(result["removal_effect"], [0.5, 1.0])
+    np.testing.assert_allclose(result["share"], [1 / 3, 2 / 3])
+    assert result["attributed_revenue"].sum() == pytest.approx(300.0)
+    assert result["attributed_conversions"].sum() == pytest.approx(2.0)
+
+
+def test_removal_effects_match_one_solve_per_removal():
+    rng = np.random.default_rng(0)
+    n = 12  # start + 9 channels + conversion + null
+    counts = rng.integers(0, 20, (n, n)) * (rng.random((n, n)) < 0.5)
+    counts[:, 0] = 0
+    counts[-2:] = 0
+    counts[1:-2, -2:] += 1  # every channel can be absorbed
+
+    probs = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    q, r = probs[:-2, :-2], probs[:-2, -2]
+    baseline = np.linalg.solve(np.eye(n - 2) - q, r)[0]
+    expected = []
+    for k in range(1, n - 2):
+        keep = np.arange(n - 2) != k
+        x = np.linalg.solve(np.eye(n - 3) - q[np.ix_(keep, keep)], r[keep])
+        expected.append(1 - x[0] / baseline)
+    np.testing.assert_allclose(removal_effects(counts), expected, rtol=1e-10)
+
+
+@pytest.fixture
+def cohort_transactions():
+    rng = np.random.default_rng(0)
+    n = 20_000
+    return pd.DataFrame({
+        "customer_id": rng.integers(0, 3_000, n),
+        "purchase_date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D"),
+        "amount": rng.gamma(2.0, 50.0, n),
+    })
+
+
+def test_period_index_round_trip():
+    dates = pd.to_datetime(["2024-01-01", "2024-01-07", "2024-01-08", "2024-02-29"])
+    weeks = period_index(dates, "W")
+    assert list(weeks - weeks[0]) == [0, 0, 1, 8]
+    assert list(period_start(weeks, "W").day_name()) == ["Monday"] * 4
+    assert list(period_start(period_index(dates, "M"), "M")) == list(pd.to_datetime(
+        ["2024-01-01", "2024-01-01", "2024-01-01", "2024-02-01"]))
+
+
+def test_cohort_triangles_match_groupby(cohort_transactions):
+    state = build_cohorts(cohort_transactions, "M")
+    retention = retention_triangle(state)
+
+    df = cohort_transactions.assign(period=cohort_transactions["purchase_date"].dt.to_period("M"))
+    df["cohort"] = df.groupby("customer_id")["period"].transform("min")
+    df["offset"] = (df["period"] - df["cohort"]).apply(lambda p: p.n)
+    active = df.groupby(["cohort", "offset"])["customer_id"].nunique().unstack()
+    sizes = active[0]
+    expected = active.div(sizes, axis=0)
+    np.testing.assert_allclose(retention.to_numpy(), expected.to_numpy())
+    assert cohort_sizes(state).tolist() == sizes.tolist()
+    assert cohort_sizes(state).sum() == cohort_transactions["customer_id"].nunique()
+
+    revenue = df.groupby(["cohort", "offset"])["amount"].sum().unstack().fillna(0).cumsum(axis=1)
+    observed = ~np.isnan(retention.to_numpy())
+    np.testing.assert_allclose(revenue_triangle(state).to_numpy()[observed], revenue.to_numpy()[observed])
+    np.testing.assert_allclose(
+        ltv_triangle(state).to_numpy()[observed], revenue.div(sizes, axis=0).to_numpy()[observed])
+    # triangle: the last cohort has only its first period observed
+    assert retention.iloc[-1].notna().sum() == 1
+
+
+def test_incremental_cohorts_match_full_build(cohort_transactions):
+    full = build_cohorts(cohort_transactions, "W")
+    ordered = cohort_transactions.sort_values("purchase_date")
+    state = build_cohorts(ordered.iloc[:5_000], "W")
+    for start in range(5_000, len(ordered), 4_000):
+        update_cohorts(state, ordered.iloc[start:start + 4_000])
+    np.testing.assert_array_equal(state.active, full.active)
+    np.testing.assert_allclose(state.revenue, full.revenue)
+    pd.testing.assert_frame_equal(retention_triangle(state), retention_triangle(full))
+
+
+def test_unsorted_cohort_updates(cohort_transactions):
+    full = build_cohorts(cohort_transactions, "W")
+    # shuffled batches mixed with late rows still count every customer-period once
+    ordered = cohort_transactions.sort_values("purchase_date")
+    head, tail = ordered.iloc[:10_000], ordered.iloc[10_000:]
+    repeat = head["purchase_date"] > head.groupby("customer_id")["purchase_date"].transform("min")
+    late = head[repeat].iloc[::5]
+    state = build_cohorts(head.drop(late.index), "W")
+    for batch, rows in ((tail.iloc[:5_000], late.iloc[::2]), (tail.iloc[5_000:], late.iloc[1::2])):
+        update_cohorts(state, pd.concat([batch, rows]).sample(frac=1, random_state=3))
+    np.testing.assert_array_equal(state.active, full.active)
+    np.testing.assert_allclose(state.revenue, full.revenue)
+
+    # a row predating its customer's cohort is rejected without touching the state
+    state = build_cohorts(tail, "W")
+    active, revenue, first = state.active.copy(), state.revenue.copy(), state.first_period.copy()
+    with pytest.raises(ValueError, match="rebuild"):
+        update_cohorts(state, pd.concat([head.iloc[-5:], head[head["customer_id"].isin(tail["customer_id"])]]))
+    np.testing.assert_array_equal(state.active, active)
+    np.testing.assert_array_equal(state.revenue, revenue)
+    np.testing.assert_array_equal(state.first_period, first)
+    rebuilt = build_cohorts(pd.concat([tail, head]), "W")
+    np.testing.assert_array_equal(rebuilt.active, full.active)
+    np.testing.assert_allclose(rebuilt.revenue, full.revenue)
+
+
+def test_cohorts_by_first_touch(cohort_transactions):
+    first_touch = pd.Series(np.where(np.arange(3_000) % 2, "Email", "Google"))
+    state = build_cohorts(cohort_transactions, "M", first_touch=first_touch.iloc[:2_000])
+    sizes = cohort_sizes(state)
+    assert sizes.index.names == ["cohort", "first_touch"]
+    by_channel = sizes.groupby(level="first_touch").sum()
+    customers = cohort_transactions["customer_id"].unique()
+    assert by_channel["(none)"] == (customers >= 2_000).sum()
+    assert by_channel["Email"] == ((customers < 2_000) & (customers % 2 == 1)).sum()
+
+
 def test_prepare_time_series_and_forecast(sample_ts):
     ts = prepare_time_series(
         df=pd.DataFrame({"date": sample_ts.index, "purchase_amount": sample_ts.values}),
@@ -70,3 +273,141 @@ def test_prepare_time_series_and_forecast(sample_ts):
     # Forecasts should be non-negative
     assert (forecast >= 0).all()
 
+
+@pytest.fixture
+def seasonal_panel():
+    rng = np.random.default_rng(7)
+    t = np.arange(120)
+    slope = rng.uniform(-0.5, 0.5, (8, 1))
+    weekly = rng.uniform(5, 20, (8, 1)) * np.sin(2 * np.pi * t / 7)
+    return 100 + slope * t + weekly + rng.normal(0, 3, (8, 120)) + np.cumsum(rng.normal(0, 1, (8, 120)), axis=1)
+
+
+@pytest.mark.parametrize("trend, seasonal", [("add", "add"), ("add", None), (None, "add"), (None, None)])
+def test_batch_holt_winters_matches_statsmodels(seasonal_panel, trend, seasonal):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    periods = 7 if seasonal else None
+    result = fit_many(seasonal_panel, trend=trend, seasonal=seasonal, seasonal_periods=periods)
+    ours = result.forecast(14)
+    for i, y in enumerate(seasonal_panel):
+        fit = ExponentialSmoothing(y, trend=trend, seasonal=seasonal, seasonal_periods=periods).fit()
+        # exact initial states make the batched fit at least as good as the local optimizer
+        assert result.sse[i] <= fit.sse * 1.002
+        np.testing.assert_allclose(ours[i], fit.forecast(14), atol=0.02 * np.abs(y).mean())
+
+
+def test_forecast_many_frame():
+    index = pd.date_range("2024-01-01", periods=60, freq="D")
+    t = np.arange(60)
+    frame = pd.DataFrame({
+        "linear": 10 + 2.0 * t,
+        "weekly": 50 + 5 * np.tile([1, 0, -1, 0, 2, -2, 0], 9)[:60],
+    }, index=index)
+    forecast = forecast_many(frame, periods=10, trend="add", seasonal="add", seasonal_periods=7)
+    assert list(forecast.columns) == ["linear", "weekly"]
+    assert forecast.index[0] == pd.Timestamp("2024-03-01") and len(forecast) == 10
+    # noiseless series are reproduced exactly
+    np.testing.assert_allclose(forecast["linear"], 10 + 2.0 * np.arange(60, 70), atol=1e-6)
+    np.testing.assert_allclose(forecast["weekly"], (frame["weekly"].iloc[-7:].tolist() * 2)[:10], atol=1e-6)
+
+    with pytest.raises(ValueError):
+        fit_many(frame.to_numpy().T, trend="mul")
+    with pytest.raises(ValueError):
+        fit_many(frame.to_numpy().T, seasonal="add")
+
+
+
+@pytest.fixture
+def media_mix():
+    # three channels with known decay / half-saturation / coefficient
+    rng = np.random.default_rng(1)
+    dates = pd.date_range("2024-01-01", periods=200, freq="D")
+    spend = pd.DataFrame(rng.uniform(0, 100, (200, 3)), index=dates, columns=["a", "b", "c"])
+    stocked = adstock(spend.to_numpy(), np.array([0.0, 0.5, 0.8]))
+    features = np.column_stack([
+        saturation(stocked[0][:, 0], 50),
+        saturation(stocked[1][:, 1], 100),
+        saturation(stocked[2][:, 2], 400),
+    ])
+    revenue = pd.Series(10 + features @ np.array([100, 300, 50]) + rng.normal(0, 2, 200), index=dates)
+    return spend, revenue
+
+
+def test_adstock_matches_recursion():
+    spend = np.array([[1.0], [0.0], [2.0]])
+    out = adstock(spend, np.array([0.0, 0.5]))
+    assert out.shape == (2, 3, 1)
+    np.testing.assert_allclose(out[1, :, 0], [1.0, 0.5, 2.25])
+    np.testing.assert_allclose(out[0], spend)
+
+
+def test_fit_and_optimize_budget(media_mix):
+    spend, revenue = media_mix
+    curves = fit_response_curves(spend, revenue)
+    assert curves.r2 > 0.9
+    assert curves.decay[0] < curves.decay[1] < curves.decay[2]
+
+    # vectorized scoring agrees with one-at-a-time scoring
+    candidates = np.array([[50.0, 50.0, 50.0], [100.0, 50.0, 0.0]])
+    single = [simulate_allocations(curves, c[None])[0] for c in candidates]
+    np.testing.assert_allclose(simulate_allocations(curves, candidates), single)
+
+    plan = optimize_budget(curves, total_budget=150.0, n_candidates=2000)
+    assert plan["spend"].sum() == pytest.approx(150.0)
+    best = simulate_allocations(curves, plan["spend"].to_numpy()[None])[0]
+    equal = simulate_allocations(curves, np.full((1, 3), 50.0))[0]
+    assert best >= equal
+
+    # a zero budget allocates nothing instead of dividing by zero
+    idle = optimize_budget(curves, total_budget=0.0)
+    assert (idle[["spend", "share", "expected_revenue"]].to_numpy() == 0).all()
+    with pytest.raises(ValueError):
+        optimize_budget(curves, total_budget=-1.0)
+
+
+def test_rolling_origin_cutoffs():
+    assert rolling_origin_cutoffs(100, horizon=10, n_cutoffs=3, min_train=50) == [70, 80, 90]
+    assert rolling_origin_cutoffs(100, horizon=10, n_cutoffs=5, min_train=75) == [80, 90]
+
+
+def test_forecast_errors():
+    errors = forecast_errors(np.array([100.0, 0.0]), np.array([110.0, 0.0]))
+    assert errors["mape"] == pytest.approx(0.1)
+    assert errors["mae"] == pytest.approx(5.0)
+    # zero actual and zero forecast counts as a perfect point
+    assert errors["smape"] == pytest.approx((2 * 10 / 210) / 2)
+
+
+def test_run_backtest_parallel_matches_serial():
+    dates = pd.date_range("2024-01-01", periods=70, freq="D")
+    weekly = np.tile([0, 5, 10, 5, 0, -5, -10], 10)
+    series = {
+        "trend": pd.Series(100 + np.arange(70) * 2.0, index=dates),
+        "seasonal": pd.Series(200 + weekly, index=dates, dtype=float),
+    }
+    configs = config_grid(trends=(None, "add"), seasonals=(None, "add"), seasonal_periods=(7,))
+    forecast_logger = logging.getLogger("models.roi_forecast")
+    forecast_logger.setLevel(logging.DEBUG)
+    serial = run_backtest(series, configs, horizon=7, n_cutoffs=3, min_train=28, max_workers=1)
+    # the in-process run leaves the host application's logging as it was
+    assert forecast_logger.level == logging.DEBUG
+    forecast_logger.setLevel(logging.NOTSET)
+    parallel = run_backtest(series, configs, horizon=7, n_cutoffs=3, min_train=28, max_workers=2)
+    assert len(serial) == 2 * len(configs) * 3
+    pd.testing.assert_frame_equal(serial, parallel)
+
+    best = select_best_configs(summarize_backtest(serial), configs, metric="mae")
+    assert best.loc["trend", "params"]["trend"] == "add"
+    assert best.loc["seasonal", "params"]["seasonal"] == "add"
+
+
+def test_backtest_of_too_short_series():
+    series = {"short": pd.Series(np.arange(20.0), index=pd.date_range("2024-01-01", periods=20, freq="D"))}
+    configs = config_grid()
+    results = run_backtest(series, configs, horizon=7, min_train=28, max_workers=2)
+    assert results.empty
+    assert list(results.columns) == ["series", "config_id", "config", "cutoff", "mape", "smape", "mae", "error"]
+    summary = summarize_backtest(results)
+    assert summary.empty
+    assert select_best_configs(summary, configs).empty